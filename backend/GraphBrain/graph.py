@@ -10,13 +10,20 @@ Implements a multi-node pipeline with:
 Uses Groq for all LLM operations.
 """
 
+import asyncio
+import functools
+import hashlib
+import json
 import logging
 import re
-from typing import TypedDict
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, TypedDict
 
-from langgraph.graph import END, START, StateGraph
-
-from groq import Groq
+# langgraph and groq are imported where first used to keep module import cheap
+if TYPE_CHECKING:
+    from langgraph.graph import StateGraph
 
 logger = logging.getLogger(__name__)
 
@@ -25,21 +32,155 @@ logger = logging.getLogger(__name__)
 # GREETING PATTERNS
 # =============================================================================
 
+# Greeting phrases; each is matched against the whole query, allowing
+# surrounding whitespace and trailing punctuation
 GREETING_PATTERNS: list[str] = [
-    r"^\s*(hi|hey|hello|hola|sup|yo)\s*[!.,?]*\s*$",
-    r"^\s*(good\s*(morning|afternoon|evening))\s*[!.,?]*\s*$",
-    r"^\s*what'?s\s*up\s*[!.,?]*\s*$",
-    r"^\s*how\s*are\s*you\s*[!.,?]*\s*$",
-    r"^\s*help\s*[!.,?]*\s*$",
-    r"^\s*(thanks|thank\s*you)\s*[!.,?]*\s*$",
+    r"(hi|hey|hello|hola|sup|yo)",
+    r"(good\s*(morning|afternoon|evening))",
+    r"what'?s\s*up",
+    r"how\s*are\s*you",
+    r"help",
+    r"(thanks|thank\s*you)",
 ]
 
+# Single pre-compiled alternation with the shared anchor and suffix factored
+# out, so a non-greeting fails after one pass (used with fullmatch)
+_GREETING_RE = re.compile(
+    r"\s*(?:" + "|".join(GREETING_PATTERNS) + r")\s*[!.,?]*\s*",
+    re.IGNORECASE,
+)
+
+# Generic "tell me about the document" queries that skip LLM grading.
+# Shared prefixes are factored out so each position tries one branch per
+# leading letter: summar*, what is this|what does. Only the leading word
+# boundary is anchored, so inflections (contents, summarised, explained)
+# still match.
+_GENERIC_RE = re.compile(
+    r"\b(summar\w*|what\s*(?:is\s*this|does)|about|describ\w*|explain\w*"
+    r"|overview|tell\s*me|content\w*)",
+    re.IGNORECASE,
+)
+
+# Filler words dropped when building a keyword-only query expansion
+_STOPWORDS: frozenset[str] = frozenset({
+    "the", "and", "for", "are", "was", "were", "what", "which", "who", "whom",
+    "this", "that", "these", "those", "with", "from", "into", "about", "does",
+    "did", "how", "why", "when", "where", "can", "could", "would", "should",
+    "will", "there", "their", "them", "they", "you", "your", "have", "has",
+    "had", "its", "not", "but", "any", "all", "tell", "please", "show",
+})
+
+
+# =============================================================================
+# PROMPT TEMPLATES
+# =============================================================================
+# Static prompt text, rendered with str.format_map on each call
+
+# Strict single-figure grading prompt
+GRADE_FIGURE_TMPL = """You are a STRICT figure relevance grader. Only accept figures that DIRECTLY answer the query.
+
+
+User Query: {query}
+
+Figure Description:
+{content}
+
+STRICT RULES:
+1. Answer 'yes' ONLY if this specific figure directly illustrates what the user is asking about.
+2. The figure must contain the EXACT concepts, structures, or diagrams mentioned in the query.
+3. Answer 'no' if the figure is only tangentially related or from a different section.
+4. When in doubt, answer 'no' - only the most relevant figure should be shown.
+
+Is this figure DIRECTLY relevant? Answer 'yes' or 'no'."""
+
+# High-recall single-document grading prompt
+GRADE_TEXT_TMPL = """You are a HIGH-RECALL relevance grader. Your goal is to NEVER miss relevant documents.
+
+RULES:
+1. If the document contains ANY keywords from the user question, answer 'yes'.
+2. If the document is even REMOTELY related, answer 'yes'.
+3. If you are unsure, answer 'yes'.
+4. Only answer 'no' if the document is COMPLETELY unrelated.
+
+User Query: {query}
+
+Document Content:
+{content}
+
+Is this document relevant? Answer ONLY 'yes' or 'no'."""
+
+# Batched grading prompt (JSON mode)
+GRADE_BATCH_TMPL = """You are a relevance grader for a document retrieval system.
+
+RULES:
+1. For text and table documents be HIGH-RECALL: output 1 if the document contains ANY keywords from the query or is even REMOTELY related. Output 0 only if it is COMPLETELY unrelated.
+2. For figure documents be STRICT: output 1 ONLY if the figure directly illustrates the EXACT concepts in the query. When in doubt, output 0.
+
+User Query: {query}
+
+Documents:
+{docs_block}
+
+For each document [i], output 1 if relevant to the query else 0. Respond with JSON only, in document order: {{"grades": [1, 0, 1]}}"""
+
+# Answer generation prompt
+GENERATE_TMPL = """You are a structured, data-driven AI assistant that ONLY answers from the provided document context.
+
+CRITICAL RULE - NO HALLUCINATION:
+* You can ONLY answer based on the document fragments provided below.
+* If the question asks about something NOT in the documents, respond: "I don't have information about that in the uploaded document."
+* NEVER make up information. NEVER use external knowledge. ONLY use what's in the context.
+* If you're not 100% sure the answer is in the context, refuse to answer.
+
+FORMATTING RULES:
+1. Use Markdown `###` for section headers when organizing information.
+2. Use bullet points `*` for lists, facts, details.
+3. **Bold** key terms, names, numbers, and important concepts.
+4. Never write a paragraph longer than 3 lines.
+5. Do NOT say "Document 1 says...". Just state facts directly.
+
+AGENTIC BEHAVIOR:
+* At the end, ask ONE relevant follow-up question based on what you said.
+
+Document Fragments:
+{context}
+
+User Question: {query}
+
+REMEMBER: If the answer is NOT in the documents above, say "I don't have information about that in the uploaded document."
+
+Answer:"""
+
+# Query rewrite prompt
+REWRITE_TMPL = """You are a query rewriter for a document retrieval system.
+
+The original query did not retrieve relevant documents. Rewrite it to be:
+1. More specific with key terms
+2. Alternative phrasing that might match document content
+3. Expanded with related concepts
+
+Original Query: {original_query}
+
+Rewritten Query (output ONLY the new query, nothing else):"""
+
 
 # =============================================================================
 # STATE DEFINITION
 # =============================================================================
 
-class Document(TypedDict):
+class DocumentPayload(TypedDict):
+    """Serialized form of a Document, as returned by the API."""
+    id: str
+    shadow_text: str
+    original_image_path: str | None
+    element_type: str
+    source_pdf: str
+    page_number: int
+    relevance_score: float
+
+
+@dataclass(slots=True)
+class Document:
     """A retrieved document from the vector store."""
     id: str
     shadow_text: str
@@ -48,6 +189,10 @@ class Document(TypedDict):
     source_pdf: str
     page_number: int
     relevance_score: float
+    
+    def to_dict(self) -> DocumentPayload:
+        """Serialize for graph boundaries (API responses)."""
+        return asdict(self)
 
 
 class GraphState(TypedDict):
@@ -60,6 +205,12 @@ class GraphState(TypedDict):
         generation: The final generated response.
         retry_count: Number of query rewrites attempted.
         rewritten_query: The transformed query after rewrite.
+        prefetched_rewrite_docs: Results for the keyword-expanded query,
+            fetched alongside the first retrieval for use on the first retry.
+        interactive: False for offline workloads, which grade documents
+            through the Groq Batch API instead of realtime completions.
+        query_embedding: Embedding of the query searched by the last
+            retrieve, reused by later nodes.
     """
     query: str
     documents: list[Document]
@@ -67,6 +218,9 @@ class GraphState(TypedDict):
     generation: str | None
     retry_count: int
     rewritten_query: str | None
+    prefetched_rewrite_docs: list[Document] | None
+    interactive: bool
+    query_embedding: list[float] | None
 
 
 # =============================================================================
@@ -82,6 +236,68 @@ class GraphNodes:
     
     MAX_RETRIES = 2
     TOP_K = 10  # Retrieve more documents for better context coverage
+    # Query/document cosine similarity bands that bypass LLM grading
+    COSINE_REJECT = 0.25
+    COSINE_ACCEPT = 0.55
+    # Whole-retrieval bypass: when every score clears (or misses) these,
+    # grading is skipped entirely
+    BYPASS_ACCEPT = 0.78
+    BYPASS_REJECT = 0.20
+    # Keyword overlap needed to auto-accept a text document without the LLM
+    OVERLAP_MIN_HITS = 2
+    OVERLAP_MIN_RATIO = 0.5
+    # Per-document token budget in grading prompts
+    GRADE_MAX_TOKENS = 400
+    # Token budget per document in the generate context
+    CONTEXT_MAX_TOKENS = 1500
+    # Payload fetched at retrieval time; full shadow_text is loaded after grading
+    LITE_PAYLOAD_FIELDS = [
+        "shadow_text_preview",
+        "original_image_path",
+        "element_type",
+        "source_pdf",
+        "page_number",
+    ]
+    # Deterministic (temperature 0) completions kept in memory
+    LLM_CACHE_SIZE = 4096
+    LLM_CACHE_DIR = "./.waldo_llm_cache"
+    # Prototype descriptions for embedding-based intent classification
+    VISUAL_PROTOTYPE = "visual content diagram figure image chart anatomy structure"
+    TEXT_PROTOTYPE = "text definition explanation"
+    # Per-document grade cache, keyed by (query, document ID)
+    GRADE_CACHE_SIZE = 10_000
+    # Semantic answer cache for generate (keyed by the relevant doc IDs)
+    ANSWER_CACHE_SIZE = 256
+    ANSWER_CACHE_THRESHOLD = 0.92
+    ANSWER_CACHE_TTL = 3600.0
+    # Per-request timeout for short completions (grading, rewrite), seconds
+    LLM_CALL_TIMEOUT = 5.0
+    # generate completion ceiling scales with context size within these bounds
+    GENERATE_MIN_TOKENS = 256
+    GENERATE_MAX_TOKENS = 2048
+    # Concurrent grading calls in flight (stays under Groq's RPM limit)
+    GRADE_CONCURRENCY = 8
+    # RateLimitError retries, backoff doubles from the base (seconds)
+    RATE_LIMIT_RETRIES = 3
+    RATE_LIMIT_BACKOFF = 1.0
+    # Groq Batch API polling (seconds, doubled up to the max)
+    BATCH_POLL_INTERVAL = 10.0
+    BATCH_POLL_MAX_INTERVAL = 300.0
+    
+    __slots__ = (
+        "client",
+        "_completion_client",
+        "model_name",
+        "_grade_semaphore",
+        "_llm_cache",
+        "_disk_cache",
+        "_answer_cache",
+        "_grade_cache",
+        "_intent_protos",
+        "_cosine_accept",
+        "_cosine_reject",
+        "vector_store",
+    )
     
     def __init__(
         self,
@@ -90,6 +306,9 @@ class GraphNodes:
         qdrant_port: int = 6333,
         collection_name: str = "pdf_documents",
         model_name: str = "llama-3.3-70b-versatile",
+        vector_store=None,
+        cosine_accept: float | None = None,
+        cosine_reject: float | None = None,
     ) -> None:
         """
         Initialize graph nodes with required clients.
@@ -100,10 +319,39 @@ class GraphNodes:
             qdrant_port: Qdrant server port.
             collection_name: Qdrant collection name.
             model_name: Groq model to use.
+            vector_store: Optional pre-initialized VectorStore to share.
+            cosine_accept: Per-document accept band (default COSINE_ACCEPT).
+            cosine_reject: Per-document reject band (default COSINE_REJECT).
         """
-        # Initialize Groq client
-        self.client = Groq(api_key=groq_api_key)
+        # Shared async Groq client (one pooled connection set per API key)
+        self.client = _get_groq(groq_api_key)
+        # _complete retries rate limits itself; SDK retries on top would
+        # multiply attempts (and timeouts) per completion
+        self._completion_client = self.client.with_options(max_retries=0)
         self.model_name = model_name
+        self._grade_semaphore = asyncio.Semaphore(self.GRADE_CONCURRENCY)
+        self._cosine_accept = self.COSINE_ACCEPT if cosine_accept is None else cosine_accept
+        self._cosine_reject = self.COSINE_REJECT if cosine_reject is None else cosine_reject
+        
+        # LLM response cache: in-memory LRU, backed by diskcache if installed
+        self._llm_cache: OrderedDict[str, str] = OrderedDict()
+        try:
+            import diskcache
+            self._disk_cache = diskcache.Cache(self.LLM_CACHE_DIR)
+        except ImportError:
+            logger.info("diskcache not installed, LLM cache is in-memory only")
+            self._disk_cache = None
+        
+        # Answer cache: key -> (doc set hash, query embedding, answer, created)
+        self._answer_cache: OrderedDict[str, tuple] = OrderedDict()
+        # Grade cache: (query, doc ID) -> relevance flag
+        self._grade_cache: OrderedDict[tuple[str, str], bool] = OrderedDict()
+        # Intent prototype embeddings, computed on first use
+        self._intent_protos = None
+        
+        if vector_store is not None:
+            self.vector_store = vector_store
+            return
         
         # Initialize VectorStore (handles Qdrant + embeddings)
         from backend.IngestScript.services.vector_store import VectorStore
@@ -114,15 +362,114 @@ class GraphNodes:
         )
         logger.info(f"Connected to Qdrant at {qdrant_host}:{qdrant_port}")
     
+    # -------------------------------------------------------------------------
+    # LLM HELPER
+    # -------------------------------------------------------------------------
+    
+    async def _complete(
+        self, prompt: str, temperature: float, max_tokens: int, json_mode: bool = False
+    ) -> str:
+        """
+        Run a single-message Groq chat completion.
+        
+        Deterministic calls (temperature 0) are cached by a hash of the
+        prompt, model and sampling parameters.
+        
+        Args:
+            prompt: User message content.
+            temperature: Sampling temperature.
+            max_tokens: Completion token limit.
+            json_mode: Constrain the response to a JSON object.
+            
+        Returns:
+            The completion text.
+        """
+        cacheable = temperature == 0.0
+        if cacheable:
+            key = hashlib.blake2b(
+                f"{self.model_name}\x00{temperature}\x00{max_tokens}\x00{json_mode}\x00{prompt}".encode(),
+                digest_size=16,
+            ).hexdigest()
+            cached = self._llm_cache.get(key)
+            if cached is None and self._disk_cache is not None:
+                cached = self._disk_cache.get(key)
+            if cached is not None:
+                self._llm_cache[key] = cached
+                self._llm_cache.move_to_end(key)
+                return cached
+        
+        from groq import RateLimitError
+        
+        extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+        for attempt in range(self.RATE_LIMIT_RETRIES + 1):
+            try:
+                response = await self._completion_client.chat.completions.create(
+                    model=self.model_name,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=self.LLM_CALL_TIMEOUT,
+                    **extra,
+                )
+                break
+            except RateLimitError:
+                if attempt == self.RATE_LIMIT_RETRIES:
+                    raise
+                delay = self.RATE_LIMIT_BACKOFF * 2 ** attempt
+                logger.warning("[GROQ] Rate limited, retrying in %.1fs", delay)
+                await asyncio.sleep(delay)
+        content = response.choices[0].message.content
+        
+        if cacheable and content is not None:
+            self._llm_cache[key] = content
+            if len(self._llm_cache) > self.LLM_CACHE_SIZE:
+                self._llm_cache.popitem(last=False)
+            if self._disk_cache is not None:
+                self._disk_cache.set(key, content)
+        
+        return content
+    
     # -------------------------------------------------------------------------
     # RETRIEVE NODE
     # -------------------------------------------------------------------------
     
-    def retrieve(self, state: GraphState) -> GraphState:
+    @staticmethod
+    def _to_documents(results: list[dict]) -> list[Document]:
+        """
+        Convert raw vector store hits into Documents.
+        
+        Qdrant returns each point at most once per query, so hits need
+        no de-duplication.
+        
+        Args:
+            results: Search results from the VectorStore.
+            
+        Returns:
+            List of documents in result order.
+        """
+        return [
+            Document(
+                id=str(doc["id"]),
+                shadow_text=doc.get("shadow_text") or doc.get("shadow_text_preview", ""),
+                original_image_path=doc.get("original_image_path"),
+                element_type=doc.get("element_type", ""),
+                source_pdf=doc.get("source_pdf", ""),
+                page_number=doc.get("page_number", 0),
+                relevance_score=doc.get("score", 0.0),
+            )
+            for doc in results
+        ]
+    
+    def retrieve(self, state: GraphState) -> dict:
         """
         Fetch documents from Qdrant based on the query using semantic search.
         
-        Uses HYBRID RETRIEVAL: Semantic search + always include figures.
+        Only a preview of each document's text is fetched; generate loads
+        the full text for documents that pass grading.
+        
+        On the first pass, the original query and a keyword-only expansion
+        are searched in one batched request; the expansion's results are
+        kept in state so the first rewrite retry needs no extra round-trip.
         
         Args:
             state: Current graph state with query.
@@ -130,44 +477,64 @@ class GraphNodes:
         Returns:
             Updated state with retrieved documents.
         """
-        query = state.get("rewritten_query") or state["query"]
-        logger.info(f"[RETRIEVE] Query: '{query}'")
+        query = _query(state)
+        logger.info("[RETRIEVE] Query: '%s'", query)
         
+        prefetched = state.get("prefetched_rewrite_docs")
+        if state.get("rewritten_query") and prefetched:
+            logger.info("[RETRIEVE] Using %d prefetched documents", len(prefetched))
+            try:
+                # Embedded alongside the original query on the first pass
+                query_embedding = self.vector_store.embed_queries([query])[0]
+            except Exception as e:
+                logger.error("[RETRIEVE] Error embedding query: %s", e)
+                query_embedding = None
+            return {
+                "documents": prefetched,
+                "relevant_documents": [],
+                "prefetched_rewrite_docs": None,
+                "query_embedding": query_embedding,
+            }
+        
+        spare: list[Document] | None = None
+        query_embedding: list[float] | None = None
         try:
-            # HYBRID RETRIEVAL: Get semantic results + all figures
-            # 1. Semantic search for top-K results
-            results = self.vector_store.search(query=query, limit=self.TOP_K)
+            expanded = _expand_query(query) if state.get("retry_count", 0) == 0 else None
             
-            documents: list[Document] = []
-            seen_ids = set()
+            # Embed here so later nodes can reuse the query vector
+            queries = [query, expanded] if expanded else [query]
+            vectors = self.vector_store.embed_queries(queries)
+            query_embedding = vectors[0]
             
-            for doc in results:
-                doc_id = str(doc.get("id", ""))
-                if doc_id in seen_ids:
-                    continue
-                seen_ids.add(doc_id)
-                
-                document: Document = {
-                    "id": doc_id,
-                    "shadow_text": doc.get("shadow_text", ""),
-                    "original_image_path": doc.get("original_image_path"),
-                    "element_type": doc.get("element_type", ""),
-                    "source_pdf": doc.get("source_pdf", ""),
-                    "page_number": doc.get("page_number", 0),
-                    "relevance_score": doc.get("score", 0.0),
-                }
-                documents.append(document)
+            if expanded:
+                results, spare_results = self.vector_store.search_many(
+                    queries=queries,
+                    limit=self.TOP_K,
+                    payload_fields=self.LITE_PAYLOAD_FIELDS,
+                    query_vectors=vectors,
+                )
+                spare = self._to_documents(spare_results)
+                logger.info("[RETRIEVE] Prefetched %d documents for '%s'", len(spare), expanded)
+            else:
+                results = self.vector_store.search(
+                    query=query,
+                    limit=self.TOP_K,
+                    payload_fields=self.LITE_PAYLOAD_FIELDS,
+                    query_vector=query_embedding,
+                )
             
-            logger.info(f"[RETRIEVE] Found {len(documents)} documents")
+            documents = self._to_documents(results)
+            logger.info("[RETRIEVE] Found %d documents", len(documents))
             
         except Exception as e:
-            logger.error(f"[RETRIEVE] Error: {e}")
+            logger.error("[RETRIEVE] Error: %s", e)
             documents = []
         
         return {
-            **state,
             "documents": documents,
             "relevant_documents": [],
+            "prefetched_rewrite_docs": spare,
+            "query_embedding": query_embedding,
         }
 
 
@@ -176,11 +543,320 @@ class GraphNodes:
     # GRADE DOCUMENTS NODE (Hallucination Grader)
     # -------------------------------------------------------------------------
     
-    def grade_documents(self, state: GraphState) -> GraphState:
+    def _grade_prompt(self, doc: Document, query: str) -> str:
+        """
+        Build the single-document grading prompt.
+        
+        Args:
+            doc: Document to grade.
+            query: The query to grade against.
+            
+        Returns:
+            Strict prompt for figures, high-recall prompt otherwise.
+        """
+        content = _snippet(doc.shadow_text, query, self.GRADE_MAX_TOKENS)
+        
+        # Create specialized prompt based on document type
+        if doc.element_type == "figure":
+            # For figures, use strict grading
+            return GRADE_FIGURE_TMPL.format_map({"query": query, "content": content})
+        else:
+            return GRADE_TEXT_TMPL.format_map({"query": query, "content": content})
+
+    async def _grade_one(self, doc: Document, query: str) -> tuple[Document, bool]:
+        """
+        Grade a single document for relevance using Groq LLM.
+        
+        Args:
+            doc: Document to grade.
+            query: The query to grade against.
+            
+        Returns:
+            Tuple of (document, is_relevant).
+        """
+        prompt = self._grade_prompt(doc, query)
+        async with self._grade_semaphore:
+            content = await self._complete(prompt, temperature=0.0, max_tokens=10)
+        
+        # First non-space character decides: 'yes' -> relevant
+        is_relevant = bool(content) and content.lstrip()[:1] in ("y", "Y")
+        
+        logger.info(
+            "[GRADE] Doc %.8s... (%s, p%s): %s",
+            doc.id, doc.element_type, doc.page_number, content,
+        )
+        return doc, is_relevant
+    
+    async def _grade_batch(self, documents: list[Document], query: str) -> list[bool]:
+        """
+        Grade all documents for relevance in a single Groq call.
+        
+        The model returns (in JSON mode) an object whose "grades" array
+        holds one relevance bit per document.
+        
+        Args:
+            documents: Documents to grade.
+            query: The query to grade against.
+            
+        Returns:
+            List of relevance flags in document order.
+            
+        Raises:
+            ValueError: If the response has no grades array of the right length.
+        """
+        if not documents:
+            return []
+        
+        docs_block = "\n".join(
+            f"[{i}] ({d.element_type}) {_snippet(d.shadow_text, query, self.GRADE_MAX_TOKENS)}"
+            for i, d in enumerate(documents)
+        )
+        prompt = GRADE_BATCH_TMPL.format_map({"query": query, "docs_block": docs_block})
+
+        content = await self._complete(
+            prompt, temperature=0.0, max_tokens=3 * len(documents) + 16, json_mode=True
+        )
+        bits = json.loads(content).get("grades")
+        if not isinstance(bits, list) or len(bits) != len(documents):
+            raise ValueError(f"Expected {len(documents)} grades, got: {bits!r}")
+        
+        grades = [bool(int(b)) for b in bits]
+        if logger.isEnabledFor(logging.INFO):
+            for doc, is_relevant in zip(documents, grades):
+                logger.info(
+                    "[GRADE] Doc %.8s... (%s, p%s): %s",
+                    doc.id, doc.element_type, doc.page_number,
+                    "yes" if is_relevant else "no",
+                )
+        return grades
+    
+    async def grade_documents_batch(
+        self, documents: list[Document], query: str
+    ) -> list[bool | BaseException]:
+        """
+        Grade documents through the Groq Batch API (offline workloads).
+        
+        Uploads one chat-completion request per document as JSONL, submits
+        a batch job, polls until it finishes and parses the output file.
+        
+        Args:
+            documents: Documents to grade.
+            query: The query to grade against.
+            
+        Returns:
+            Relevance flags in document order; an exception for any
+            document whose request failed.
+            
+        Raises:
+            RuntimeError: If the batch job does not complete.
+        """
+        if not documents:
+            return []
+        
+        lines = [
+            json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.model_name,
+                    "messages": [{"role": "user", "content": self._grade_prompt(doc, query)}],
+                    "temperature": 0.0,
+                    "max_tokens": 10,
+                },
+            })
+            for i, doc in enumerate(documents)
+        ]
+        
+        input_file = await self.client.files.create(
+            file=("grade_requests.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch",
+        )
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        logger.info("[GRADE] Submitted batch %s with %d requests", batch.id, len(documents))
+        
+        delay = self.BATCH_POLL_INTERVAL
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.BATCH_POLL_MAX_INTERVAL)
+            batch = await self.client.batches.retrieve(batch.id)
+        
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'")
+        
+        output = await self.client.files.content(batch.output_file_id)
+        results: list[bool | BaseException] = [
+            RuntimeError("Missing batch result") for _ in documents
+        ]
+        for line in (await output.text()).splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            idx = int(record["custom_id"])
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                results[idx] = RuntimeError(f"Batch request failed: {record.get('error')}")
+                continue
+            grade = response["body"]["choices"][0]["message"]["content"] or ""
+            results[idx] = grade.lstrip()[:1] in ("y", "Y")
+        
+        logger.info("[GRADE] Batch %s completed", batch.id)
+        return results
+    
+    async def _embed_query(self, query: str):
+        """
+        Embed a query off the event loop, through the vector store's query cache.
+        
+        Args:
+            query: Text to embed.
+            
+        Returns:
+            Normalized embedding as a numpy array.
+        """
+        vectors = await asyncio.to_thread(self.vector_store.embed_queries, [query])
+        import numpy as np
+        return np.asarray(vectors[0], dtype=np.float32)
+    
+    async def _query_embedding(self, state: GraphState, query: str):
+        """
+        Return the query embedding from state, embedding the query if absent.
+        
+        Args:
+            state: Current graph state.
+            query: The query the embedding is for.
+            
+        Returns:
+            Normalized embedding as a numpy array.
+        """
+        embedding = state.get("query_embedding")
+        if embedding is None:
+            return await self._embed_query(query)
+        import numpy as np
+        return np.asarray(embedding, dtype=np.float32)
+    
+    async def _classify_intent(self, state: GraphState, query: str) -> bool:
+        """
+        Decide whether a query would benefit from visual content.
+        
+        Compares the query embedding against visual and text prototype
+        embeddings instead of asking the LLM.
+        
+        Args:
+            state: Current graph state (for the cached query embedding).
+            query: The user query.
+            
+        Returns:
+            True if visual content would help, False otherwise (including
+            on classification failure).
+        """
+        needs_visual = False
+        try:
+            if self._intent_protos is None:
+                self._intent_protos = await asyncio.to_thread(
+                    self.vector_store.embed_texts,
+                    [self.VISUAL_PROTOTYPE, self.TEXT_PROTOTYPE],
+                )
+            visual_proto, text_proto = self._intent_protos
+            embedding = await self._query_embedding(state, query)
+            needs_visual = float(embedding @ visual_proto) > float(embedding @ text_proto)
+            logger.info("[GRADE] Query intent analysis: '%s' -> %s", query, "VISUAL" if needs_visual else "TEXT")
+        except Exception as e:
+            logger.warning("[GRADE] Intent classification failed: %s, defaulting to text-only", e)
+        return needs_visual
+    
+    async def _grade_results(
+        self,
+        state: GraphState,
+        query: str,
+        documents: list[Document],
+        scores: list[float],
+    ) -> list[bool | BaseException | None]:
+        """
+        Grade documents through the pre-filters, the grade cache and the LLM.
+        
+        Args:
+            state: Current graph state.
+            query: The query to grade against.
+            documents: Retrieved documents.
+            scores: Qdrant scores of the documents, in order.
+            
+        Returns:
+            One relevance flag (or grading error) per document, in order.
+        """
+        # Intent classification runs concurrently with grading
+        intent_task = asyncio.create_task(self._classify_intent(state, query))
+        
+        results: list[bool | BaseException | None] = [None] * len(documents)
+        
+        # COSINE PRE-FILTER: relevance_score is Qdrant's query/doc cosine
+        # similarity, so clear-cut documents need no LLM call
+        if scores:
+            logger.info("[GRADE] Score range %.3f-%.3f", min(scores), max(scores))
+        for i, doc in enumerate(documents):
+            if doc.relevance_score < self._cosine_reject:
+                results[i] = False
+            elif doc.relevance_score > self._cosine_accept:
+                results[i] = True
+        
+        # KEYWORD PRE-FILTER: text docs with strong lexical overlap skip the LLM.
+        # Figures are never accepted on keyword overlap alone.
+        q_tokens = set(_keywords(query))
+        if q_tokens:
+            for i, doc in enumerate(documents):
+                if results[i] is not None or doc.element_type == "figure":
+                    continue
+                text_lower = doc.shadow_text.lower()
+                hits = sum(1 for t in q_tokens if t in text_lower)
+                if hits >= self.OVERLAP_MIN_HITS or hits / len(q_tokens) >= self.OVERLAP_MIN_RATIO:
+                    results[i] = True
+        
+        # GRADE CACHE: documents already graded for this query
+        for i, doc in enumerate(documents):
+            if results[i] is None:
+                cached = self._grade_cache.get((query, doc.id))
+                if cached is not None:
+                    self._grade_cache.move_to_end((query, doc.id))
+                    results[i] = cached
+        
+        pending = [i for i, r in enumerate(results) if r is None]
+        logger.info("[GRADE] Pre-filters and cache decided %d/%d documents", len(documents) - len(pending), len(documents))
+        pending_docs = [documents[i] for i in pending]
+        
+        graded: list[bool | BaseException]
+        try:
+            if state.get("interactive", True):
+                graded = await self._grade_batch(pending_docs, query)
+            else:
+                graded = await self.grade_documents_batch(pending_docs, query)
+        except Exception as e:
+            logger.warning("[GRADE] Batched grading failed: %s, falling back to per-document grading", e)
+            # Fire all grading calls concurrently; results keep document order
+            gathered = await asyncio.gather(
+                *(self._grade_one(doc, query) for doc in pending_docs),
+                return_exceptions=True,
+            )
+            graded = [r if isinstance(r, BaseException) else r[1] for r in gathered]
+        
+        for i, result in zip(pending, graded):
+            results[i] = result
+            if isinstance(result, bool):
+                self._grade_cache[(query, documents[i].id)] = result
+        while len(self._grade_cache) > self.GRADE_CACHE_SIZE:
+            self._grade_cache.popitem(last=False)
+        
+        await intent_task
+        return results
+    
+    async def grade_documents(self, state: GraphState) -> dict:
         """
         Grade each document for relevance using Groq LLM.
         
-        Uses fast binary grading: 'yes' or 'no'.
+        Grades all documents in one batched call. If the batched response
+        cannot be parsed, falls back to concurrent per-document calls.
         
         Args:
             state: Current graph state with documents.
@@ -188,159 +864,164 @@ class GraphNodes:
         Returns:
             Updated state with relevant_documents filtered.
         """
-        query = state.get("rewritten_query") or state["query"]
+        query = _query(state)
         documents = state["documents"]
         
-        logger.info(f"[GRADE] Grading {len(documents)} documents...")
+        logger.info("[GRADE] Grading %d documents...", len(documents))
         
         relevant_documents: list[Document] = []
         
         # FAIL-SAFE: Generic queries auto-accept ALL documents (skip LLM)
-        generic_keywords = [
-            "summary", "summarize", "what is this", "about", "describe",
-            "explain", "overview", "tell me", "what does", "content",
-        ]
-        query_lower = query.lower()
-        is_generic_query = any(kw in query_lower for kw in generic_keywords)
+        is_generic_query = _GENERIC_RE.search(query) is not None
         
         if is_generic_query:
-            logger.info(f"[GRADE] Generic query detected: '{query}' -> auto-accepting ALL documents")
+            logger.info("[GRADE] Generic query detected: '%s' -> auto-accepting ALL documents", query)
             for doc in documents:
-                doc["relevance_score"] = 1.0
+                doc.relevance_score = 1.0
                 relevant_documents.append(doc)
             return {
-                **state,
                 "relevant_documents": relevant_documents,
+                "documents": [],
             }
         
-        # INTELLIGENT VISUAL QUERY DETECTION using LLM
-        # Ask the LLM if this query would benefit from visual content
-        needs_visual = False
-        try:
-            intent_prompt = f"""Analyze this user query and determine if it would benefit from visual content (diagrams, figures, images, charts).
-
-Query: "{query}"
-
-Consider:
-- Is the user asking about something that is better explained with a visual (anatomy, structure, process, location)?
-- Does the query reference a specific figure, diagram, or visual element?
-- Would seeing an image help answer the question more accurately?
-
-Answer ONLY "visual" if visual content would significantly help, or "text" if text alone is sufficient."""
-            
-            intent_response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": intent_prompt}],
-                temperature=0.0,
-                max_tokens=10,
-            )
-            intent = intent_response.choices[0].message.content.strip().lower()
-            needs_visual = "visual" in intent
-            logger.info(f"[GRADE] Query intent analysis: '{query}' -> {'VISUAL' if needs_visual else 'TEXT'}")
-        except Exception as e:
-            logger.warning(f"[GRADE] Intent classification failed: {e}, defaulting to text-only")
+        # DECISIVE RETRIEVAL: if every score is clearly high or clearly low,
+        # LLM grading adds nothing
+        scores = [doc.relevance_score for doc in documents]
+        accept_all = bool(scores) and min(scores) >= self.BYPASS_ACCEPT
+        if accept_all:
+            # Still capped below: at most one figure is accepted
+            logger.info("[GRADE] All scores >= %s -> auto-accepting ALL documents", self.BYPASS_ACCEPT)
+        if scores and max(scores) <= self.BYPASS_REJECT:
+            logger.info("[GRADE] All scores <= %s -> rejecting ALL documents", self.BYPASS_REJECT)
+            return {
+                "relevant_documents": [],
+                "documents": [],
+            }
+        
+        if accept_all:
+            results: list[bool | BaseException | None] = [True] * len(documents)
+        else:
+            results = await self._grade_results(state, query, documents, scores)
         
         # Track if we've already accepted a figure for visual queries (limit to 1)
         figure_accepted = False
         
-        for doc in documents:
-            # Create specialized prompt based on document type
-            if doc["element_type"] == "figure":
-                # For figures, use strict grading
-                prompt = f"""You are a STRICT figure relevance grader. Only accept figures that DIRECTLY answer the query.
-
-
-User Query: {query}
-
-Figure Description:
-{doc['shadow_text'][:2000]}
-
-STRICT RULES:
-1. Answer 'yes' ONLY if this specific figure directly illustrates what the user is asking about.
-2. The figure must contain the EXACT concepts, structures, or diagrams mentioned in the query.
-3. Answer 'no' if the figure is only tangentially related or from a different section.
-4. When in doubt, answer 'no' - only the most relevant figure should be shown.
-
-Is this figure DIRECTLY relevant? Answer 'yes' or 'no'."""
-            else:
-                prompt = f"""You are a HIGH-RECALL relevance grader. Your goal is to NEVER miss relevant documents.
-
-RULES:
-1. If the document contains ANY keywords from the user question, answer 'yes'.
-2. If the document is even REMOTELY related, answer 'yes'.
-3. If you are unsure, answer 'yes'.
-4. Only answer 'no' if the document is COMPLETELY unrelated.
-
-User Query: {query}
-
-Document Content:
-{doc['shadow_text'][:2000]}
-
-Is this document relevant? Answer ONLY 'yes' or 'no'."""
-
-            try:
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.0,
-                    max_tokens=10,
-                )
-                
-                grade = response.choices[0].message.content.strip().lower()
-                is_relevant = grade == "yes" or grade.startswith("yes")
-                
-                # For figures, only accept if we haven't accepted one yet
-                if doc["element_type"] == "figure" and is_relevant:
-                    if figure_accepted:
-                        logger.info(
-                            f"[GRADE] Doc {doc['id'][:8]}... "
-                            f"({doc['element_type']}, p{doc['page_number']}): SKIPPED (already have a figure)"
-                        )
-                        continue
-                    figure_accepted = True
-                
-                logger.info(
-                    f"[GRADE] Doc {doc['id'][:8]}... "
-                    f"({doc['element_type']}, p{doc['page_number']}): {grade}"
-                )
-                
-                if is_relevant:
-                    doc["relevance_score"] = 1.0
-                    relevant_documents.append(doc)
-                    
-            except Exception as e:
-                logger.error(f"[GRADE] Error grading doc {doc['id']}: {e}")
+        for doc, result in zip(documents, results):
+            if isinstance(result, BaseException):
+                logger.error("[GRADE] Error grading doc %s: %s", doc.id, result)
                 # On error, include the document (fail-safe) but not figures
-                if doc["element_type"] != "figure":
+                if doc.element_type != "figure":
                     relevant_documents.append(doc)
-
+                continue
+            
+            is_relevant = result
+            
+            # For figures, only accept if we haven't accepted one yet
+            if doc.element_type == "figure" and is_relevant:
+                if figure_accepted:
+                    logger.info(
+                        "[GRADE] Doc %.8s... (%s, p%s): SKIPPED (already have a figure)",
+                        doc.id, doc.element_type, doc.page_number,
+                    )
+                    continue
+                figure_accepted = True
+            
+            if is_relevant:
+                doc.relevance_score = 1.0
+                relevant_documents.append(doc)
         
-        logger.info(f"[GRADE] {len(relevant_documents)}/{len(documents)} relevant")
-
+        logger.info("[GRADE] %d/%d relevant", len(relevant_documents), len(documents))
         
         return {
-            **state,
             "relevant_documents": relevant_documents,
+            "documents": [],
         }
     
     # -------------------------------------------------------------------------
     # GENERATE NODE
     # -------------------------------------------------------------------------
     
-    def generate(self, state: GraphState) -> GraphState:
+    async def _load_full_text(self, docs: list[Document]) -> None:
+        """
+        Replace preview text with the full shadow text, in place.
+        
+        Only documents whose preview may be truncated are fetched.
+        
+        Args:
+            docs: Documents that passed grading.
+        """
+        truncated = [d for d in docs if len(d.shadow_text) >= self.vector_store.PREVIEW_CHARS]
+        if not truncated:
+            return
+        
+        try:
+            texts = await asyncio.to_thread(
+                self.vector_store.get_shadow_texts, [d.id for d in truncated]
+            )
+        except Exception as e:
+            logger.warning("[GENERATE] Could not load full text, using previews: %s", e)
+            return
+        
+        for doc in truncated:
+            doc.shadow_text = texts.get(doc.id) or doc.shadow_text
+        logger.info("[GENERATE] Loaded full text for %d documents", len(truncated))
+    
+    def _cached_answer(self, docs_key: str, embedding) -> str | None:
+        """
+        Look up a previous answer for a similar query over the same documents.
+        
+        Args:
+            docs_key: Hash of the relevant document IDs.
+            embedding: Normalized query embedding.
+            
+        Returns:
+            The cached answer, or None on a miss.
+        """
+        now = time.monotonic()
+        for key, (cached_docs, cached_emb, answer, created) in list(self._answer_cache.items()):
+            if now - created > self.ANSWER_CACHE_TTL:
+                del self._answer_cache[key]
+                continue
+            if cached_docs == docs_key and float(embedding @ cached_emb) >= self.ANSWER_CACHE_THRESHOLD:
+                self._answer_cache.move_to_end(key)
+                return answer
+        return None
+    
+    def _store_answer(self, docs_key: str, query: str, embedding, answer: str) -> None:
+        """
+        Store a generated answer in the semantic answer cache.
+        
+        Args:
+            docs_key: Hash of the relevant document IDs.
+            query: The query the answer was generated for.
+            embedding: Normalized query embedding.
+            answer: The generated answer.
+        """
+        self._answer_cache[f"{docs_key}\x00{query}"] = (docs_key, embedding, answer, time.monotonic())
+        if len(self._answer_cache) > self.ANSWER_CACHE_SIZE:
+            self._answer_cache.popitem(last=False)
+    
+    async def generate(self, state: GraphState) -> dict:
         """
         Generate final answer using Groq with relevant docs.
         
+        Tokens are streamed from Groq and forwarded to the graph's custom
+        stream as {"generation_delta": str} events.
+        
+        Answers are cached per relevant document set; a query whose
+        embedding is within ANSWER_CACHE_THRESHOLD cosine of a cached one
+        is served without calling Groq.
+        
         Args:
             state: Current graph state with relevant_documents.
             
         Returns:
             Updated state with generation.
         """
-        query = state.get("rewritten_query") or state["query"]
+        query = _query(state)
         docs = state["relevant_documents"]
         
-        logger.info(f"[GENERATE] Using {len(docs)} relevant documents")
+        logger.info("[GENERATE] Using %d relevant documents", len(docs))
         
         # OUT-OF-SCOPE CHECK: If no relevant documents, refuse to answer
         if not docs or len(docs) == 0:
@@ -351,64 +1032,73 @@ Is this document relevant? Answer ONLY 'yes' or 'no'."""
                 "Please ask a question about the document, or upload a different PDF if you'd like to explore other topics."
             )
             return {
-                **state,
                 "generation": refusal,
             }
         
-        context_parts = []
+        # SEMANTIC CACHE: reuse the answer to a near-identical query over
+        # the same documents
+        from langgraph.config import get_stream_writer
+        writer = get_stream_writer()
+        docs_key = hashlib.blake2b(
+            "\x00".join(sorted(doc.id for doc in docs)).encode(), digest_size=16
+        ).hexdigest()
+        try:
+            embedding = await self._query_embedding(state, query)
+        except Exception as e:
+            logger.warning("[GENERATE] Could not embed query for answer cache: %s", e)
+            embedding = None
+        if embedding is not None:
+            cached = self._cached_answer(docs_key, embedding)
+            if cached is not None:
+                logger.info("[GENERATE] Answer cache hit")
+                writer({"generation_delta": cached})
+                return {
+                    "generation": cached,
+                }
         
-        for i, doc in enumerate(docs, 1):
-            context_parts.append(
-                f"--- Document {i} ({doc['element_type']}, Page {doc['page_number']}) ---\n"
-                f"{doc['shadow_text']}\n"
-            )
+        await self._load_full_text(docs)
         
-        context = "\n".join(context_parts)
+        context = "\n".join(
+            f"--- Document {i} ({doc.element_type}, Page {doc.page_number}) ---\n"
+            f"{_snippet(doc.shadow_text, query, self.CONTEXT_MAX_TOKENS)}"
+            for i, doc in enumerate(docs, 1)
+        )
         
-        prompt = f"""You are a structured, data-driven AI assistant that ONLY answers from the provided document context.
-
-CRITICAL RULE - NO HALLUCINATION:
-* You can ONLY answer based on the document fragments provided below.
-* If the question asks about something NOT in the documents, respond: "I don't have information about that in the uploaded document."
-* NEVER make up information. NEVER use external knowledge. ONLY use what's in the context.
-* If you're not 100% sure the answer is in the context, refuse to answer.
-
-FORMATTING RULES:
-1. Use Markdown `###` for section headers when organizing information.
-2. Use bullet points `*` for lists, facts, details.
-3. **Bold** key terms, names, numbers, and important concepts.
-4. Never write a paragraph longer than 3 lines.
-5. Do NOT say "Document 1 says...". Just state facts directly.
-
-AGENTIC BEHAVIOR:
-* At the end, ask ONE relevant follow-up question based on what you said.
-
-Document Fragments:
-{context}
-
-User Question: {query}
-
-REMEMBER: If the answer is NOT in the documents above, say "I don't have information about that in the uploaded document."
-
-Answer:"""
+        prompt = GENERATE_TMPL.format_map({"context": context, "query": query})
 
         try:
-            response = self.client.chat.completions.create(
+            # Stream tokens so callers using astream(stream_mode="custom")
+            # can render the answer as it is produced
+            stream = await self.client.chat.completions.create(
                 model=self.model_name,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3,  # Lower temperature for more factual responses
-                max_tokens=2048,
+                # Short contexts get a proportionally short ceiling
+                max_tokens=min(
+                    self.GENERATE_MAX_TOKENS,
+                    self.GENERATE_MIN_TOKENS + 4 * len(context) // 100,
+                ),
+                stream=True,
             )
             
-            generation = response.choices[0].message.content
-            logger.info(f"[GENERATE] Generated {len(generation)} chars")
+            pieces: list[str] = []
+            async for chunk in stream:
+                piece = chunk.choices[0].delta.content
+                if piece:
+                    pieces.append(piece)
+                    writer({"generation_delta": piece})
+            
+            generation = "".join(pieces)
+            logger.info("[GENERATE] Generated %d chars", len(generation))
+            # Never serve an empty answer to similar queries
+            if embedding is not None and generation.strip():
+                self._store_answer(docs_key, query, embedding, generation)
             
         except Exception as e:
-            logger.error(f"[GENERATE] Error: {e}")
+            logger.error("[GENERATE] Error: %s", e)
             generation = f"Error generating response: {e}"
         
         return {
-            **state,
             "generation": generation,
         }
 
@@ -417,7 +1107,7 @@ Answer:"""
     # REWRITE QUERY NODE
     # -------------------------------------------------------------------------
     
-    def rewrite_query(self, state: GraphState) -> GraphState:
+    async def rewrite_query(self, state: GraphState) -> dict:
         """
         Rewrite the query to improve retrieval.
         
@@ -432,36 +1122,30 @@ Answer:"""
         original_query = state["query"]
         retry_count = state.get("retry_count", 0)
         
-        logger.info(f"[REWRITE] Attempt {retry_count + 1}/{self.MAX_RETRIES}")
+        logger.info("[REWRITE] Attempt %d/%d", retry_count + 1, self.MAX_RETRIES)
         
-        prompt = f"""You are a query rewriter for a document retrieval system.
-
-The original query did not retrieve relevant documents. Rewrite it to be:
-1. More specific with key terms
-2. Alternative phrasing that might match document content
-3. Expanded with related concepts
-
-Original Query: {original_query}
-
-Rewritten Query (output ONLY the new query, nothing else):"""
+        # First retry: reuse the keyword expansion already searched in retrieve
+        if state.get("prefetched_rewrite_docs"):
+            rewritten = _expand_query(original_query) or original_query
+            logger.info("[REWRITE] '%s' -> '%s' (prefetched)", original_query, rewritten)
+            return {
+                "rewritten_query": rewritten,
+                "retry_count": retry_count + 1,
+            }
+        
+        prompt = REWRITE_TMPL.format_map({"original_query": original_query})
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.5,
-                max_tokens=100,
-            )
+            response = await self._complete(prompt, temperature=0.5, max_tokens=100)
             
-            rewritten = response.choices[0].message.content.strip()
-            logger.info(f"[REWRITE] '{original_query}' -> '{rewritten}'")
+            rewritten = response.strip()
+            logger.info("[REWRITE] '%s' -> '%s'", original_query, rewritten)
             
         except Exception as e:
-            logger.error(f"[REWRITE] Error: {e}")
+            logger.error("[REWRITE] Error: %s", e)
             rewritten = original_query
         
         return {
-            **state,
             "rewritten_query": rewritten,
             "retry_count": retry_count + 1,
         }
@@ -470,7 +1154,7 @@ Rewritten Query (output ONLY the new query, nothing else):"""
     # DIRECT RESPONSE NODE (for greetings)
     # -------------------------------------------------------------------------
     
-    def direct_response(self, state: GraphState) -> GraphState:
+    def direct_response(self, state: GraphState) -> dict:
         """
         Handle greetings and simple queries without RAG.
         
@@ -483,14 +1167,13 @@ Rewritten Query (output ONLY the new query, nothing else):"""
             Updated state with generation (direct response).
         """
         query = state["query"]
-        logger.info(f"[DIRECT_RESPONSE] Handling greeting: '{query}'")
+        logger.info("[DIRECT_RESPONSE] Handling greeting: '%s'", query)
         
         response = (
             "Hello! I am ready to help. Please ask me about your document."
         )
         
         return {
-            **state,
             "generation": response,
             "documents": [],
             "relevant_documents": [],
@@ -501,6 +1184,157 @@ Rewritten Query (output ONLY the new query, nothing else):"""
 # CONDITIONAL EDGES
 # =============================================================================
 
+def _query(state: GraphState) -> str:
+    """Return the active query: the rewritten query if any, else the original."""
+    return state.get("rewritten_query") or state["query"]
+
+
+@functools.lru_cache(maxsize=8)
+def _get_groq(api_key: str):
+    """
+    Get the shared AsyncGroq client for an API key.
+    
+    All graphs built with the same key share one pooled httpx connection
+    set; HTTP/2 multiplexing is used when h2 is installed.
+    
+    Args:
+        api_key: Groq API key.
+        
+    Returns:
+        AsyncGroq client.
+    """
+    import httpx
+    from groq import AsyncGroq
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+    http_client = httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+    return AsyncGroq(
+        api_key=api_key,
+        http_client=http_client,
+        timeout=httpx.Timeout(20.0, connect=5.0),
+        max_retries=3,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    """Load the shared tiktoken encoder, or None if unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable ({e}), truncating by characters")
+        return None
+
+
+def _truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Truncate text to at most max_tokens tokens.
+    
+    Falls back to ~4 characters per token when tiktoken is unavailable.
+    
+    Args:
+        text: Text to truncate.
+        max_tokens: Token budget.
+        
+    Returns:
+        The truncated text.
+    """
+    enc = _get_encoding()
+    if enc is None:
+        return text[: max_tokens * 4]
+    
+    ids = enc.encode(text)
+    if len(ids) <= max_tokens:
+        return text
+    return enc.decode(ids[:max_tokens])
+
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _snippet(text: str, query: str, max_tokens: int) -> str:
+    """
+    Fit text into a token budget, keeping the most query-relevant sentences.
+    
+    Text within budget is returned unchanged. Otherwise sentences are
+    ranked by how many query keywords they contain and the best ones are
+    kept, in their original order, until the budget is used.
+    
+    Args:
+        text: Text to shorten.
+        query: Query used to rank sentences.
+        max_tokens: Token budget.
+        
+    Returns:
+        The shortened text.
+    """
+    enc = _get_encoding()
+    count = (lambda t: len(t) // 4 + 1) if enc is None else (lambda t: len(enc.encode(t)))
+    if count(text) <= max_tokens:
+        return text
+    
+    terms = _keywords(query)
+    sentences = _SENTENCE_SPLIT_RE.split(text)
+    if not terms or len(sentences) < 2:
+        return _truncate_tokens(text, max_tokens)
+    
+    def score(sentence: str) -> int:
+        lower = sentence.lower()
+        return sum(1 for t in terms if t in lower)
+    
+    # Stable sort keeps earlier sentences first among equal scores
+    ranked = sorted(range(len(sentences)), key=lambda i: -score(sentences[i]))
+    kept: list[int] = []
+    budget = max_tokens
+    for i in ranked:
+        cost = count(sentences[i])
+        if cost <= budget:
+            kept.append(i)
+            budget -= cost
+    if not kept:
+        return _truncate_tokens(text, max_tokens)
+    return " ".join(sentences[i] for i in sorted(kept))
+
+
+def _keywords(query: str) -> list[str]:
+    """
+    Extract lowercase content words from a query, dropping stopwords.
+    
+    Args:
+        query: User input query.
+        
+    Returns:
+        Keywords in query order.
+    """
+    return [
+        w for w in re.findall(r"\w+", query.lower())
+        if len(w) > 2 and w not in _STOPWORDS
+    ]
+
+
+def _expand_query(query: str) -> str | None:
+    """
+    Build a keyword-only variant of a query for speculative retrieval.
+    
+    Args:
+        query: User input query.
+        
+    Returns:
+        The expanded query, or None if it adds nothing over the original.
+    """
+    expanded = " ".join(_keywords(query))
+    if not expanded or expanded == query.lower().strip():
+        return None
+    return expanded
+
+
 def _is_greeting(query: str) -> bool:
     """
     Check if query matches known greeting patterns.
@@ -511,13 +1345,13 @@ def _is_greeting(query: str) -> bool:
     Returns:
         True if query is a greeting, False otherwise.
     """
-    query_lower = query.lower().strip()
-    
-    for pattern in GREETING_PATTERNS:
-        if re.match(pattern, query_lower, re.IGNORECASE):
-            return True
-    
-    return False
+    return _is_greeting_cached(query.lower().strip())
+
+
+@functools.lru_cache(maxsize=1024)
+def _is_greeting_cached(query_norm: str) -> bool:
+    """Memoized greeting check on an already lowercased, stripped query."""
+    return _GREETING_RE.fullmatch(query_norm) is not None
 
 
 def route_query(state: GraphState) -> str:
@@ -536,10 +1370,10 @@ def route_query(state: GraphState) -> str:
     query = state["query"]
     
     if _is_greeting(query):
-        logger.info(f"[ROUTER] Greeting detected: '{query}' -> direct_response")
+        logger.info("[ROUTER] Greeting detected: '%s' -> direct_response", query)
         return "direct_response"
     else:
-        logger.info(f"[ROUTER] RAG query: '{query}' -> retrieve")
+        logger.info("[ROUTER] RAG query: '%s' -> retrieve", query)
         return "retrieve"
 
 
@@ -561,7 +1395,7 @@ def should_rewrite_or_generate(state: GraphState) -> str:
         if len(relevant_docs) == 0:
             logger.info("[ROUTER] No relevant docs but max retries -> generate")
         else:
-            logger.info(f"[ROUTER] {len(relevant_docs)} relevant docs -> generate")
+            logger.info("[ROUTER] %d relevant docs -> generate", len(relevant_docs))
         return "generate"
 
 
@@ -569,33 +1403,20 @@ def should_rewrite_or_generate(state: GraphState) -> str:
 # GRAPH BUILDER
 # =============================================================================
 
-def build_graph(
-    groq_api_key: str,
-    qdrant_host: str = "localhost",
-    qdrant_port: int = 6333,
-    collection_name: str = "pdf_documents",
-    model_name: str = "llama-3.3-70b-versatile",
-) -> StateGraph:
+def _compile_graph(nodes: GraphNodes) -> "StateGraph":
     """
-    Build the compiled LangGraph state machine.
+    Wire the node methods of a GraphNodes instance into a compiled graph.
+    
+    Node methods are bound once here so each hop dispatches straight to
+    the bound coroutine.
     
     Args:
-        groq_api_key: Groq API key.
-        qdrant_host: Qdrant server host.
-        qdrant_port: Qdrant server port.
-        collection_name: Qdrant collection name.
-        model_name: Groq model to use.
+        nodes: Initialized graph nodes.
         
     Returns:
         Compiled StateGraph ready for invocation.
     """
-    nodes = GraphNodes(
-        groq_api_key=groq_api_key,
-        qdrant_host=qdrant_host,
-        qdrant_port=qdrant_port,
-        collection_name=collection_name,
-        model_name=model_name,
-    )
+    from langgraph.graph import END, START, StateGraph
     
     workflow = StateGraph(GraphState)
     
@@ -636,7 +1457,44 @@ def build_graph(
     # Generate ends the graph
     workflow.add_edge("generate", END)
     
-    graph = workflow.compile()
+    return workflow.compile()
+
+
+def build_graph(
+    groq_api_key: str,
+    qdrant_host: str = "localhost",
+    qdrant_port: int = 6333,
+    collection_name: str = "pdf_documents",
+    model_name: str = "llama-3.3-70b-versatile",
+    cosine_accept: float | None = None,
+    cosine_reject: float | None = None,
+) -> "StateGraph":
+    """
+    Build the compiled LangGraph state machine.
+    
+    Args:
+        groq_api_key: Groq API key.
+        qdrant_host: Qdrant server host.
+        qdrant_port: Qdrant server port.
+        collection_name: Qdrant collection name.
+        model_name: Groq model to use.
+        cosine_accept: Per-document cosine accept band.
+        cosine_reject: Per-document cosine reject band.
+        
+    Returns:
+        Compiled StateGraph ready for invocation.
+    """
+    nodes = GraphNodes(
+        groq_api_key=groq_api_key,
+        qdrant_host=qdrant_host,
+        qdrant_port=qdrant_port,
+        collection_name=collection_name,
+        model_name=model_name,
+        cosine_accept=cosine_accept,
+        cosine_reject=cosine_reject,
+    )
+    
+    graph = _compile_graph(nodes)
     
     logger.info("Graph compiled successfully")
     return graph
@@ -664,6 +1522,8 @@ def create_rag_graph_from_settings():
         qdrant_port=None,
         collection_name=settings.qdrant_collection_name,
         model_name=settings.groq_model,
+        cosine_accept=settings.grade_cosine_accept,
+        cosine_reject=settings.grade_cosine_reject,
     )
 
 
@@ -671,6 +1531,8 @@ def build_graph_with_vector_store(
     groq_api_key: str,
     vector_store,
     model_name: str = "llama-3.3-70b-versatile",
+    cosine_accept: float | None = None,
+    cosine_reject: float | None = None,
 ):
     """
     Build the RAG graph using an EXISTING VectorStore instance.
@@ -680,42 +1542,22 @@ def build_graph_with_vector_store(
         groq_api_key: Groq API key.
         vector_store: Pre-initialized VectorStore instance (shared).
         model_name: Groq model to use.
+        cosine_accept: Per-document cosine accept band.
+        cosine_reject: Per-document cosine reject band.
         
     Returns:
         Compiled StateGraph.
     """
-    # Create nodes - we'll manually set the vector_store after creation
-    nodes = object.__new__(GraphNodes)
-    nodes.client = Groq(api_key=groq_api_key)
-    nodes.model_name = model_name
-    nodes.vector_store = vector_store  # USE SHARED INSTANCE - critical!
-    logger.info(f"Using SHARED VectorStore instance")
-    
-    # Build graph
-    graph = StateGraph(GraphState)
-    
-    # Add nodes
-    graph.add_node("retrieve", nodes.retrieve)
-    graph.add_node("grade_documents", nodes.grade_documents)
-    graph.add_node("generate", nodes.generate)
-    graph.add_node("rewrite_query", nodes.rewrite_query)
-    graph.add_node("direct_response", nodes.direct_response)
-    
-    # Add edges - use standalone route functions
-    graph.add_conditional_edges(
-        START,
-        route_query,  # standalone function
-    )
-    graph.add_edge("retrieve", "grade_documents")
-    graph.add_conditional_edges(
-        "grade_documents",
-        should_rewrite_or_generate,  # standalone function
+    nodes = GraphNodes(
+        groq_api_key=groq_api_key,
+        model_name=model_name,
+        vector_store=vector_store,  # USE SHARED INSTANCE - critical!
+        cosine_accept=cosine_accept,
+        cosine_reject=cosine_reject,
     )
-    graph.add_edge("rewrite_query", "retrieve")
-    graph.add_edge("generate", END)
-    graph.add_edge("direct_response", END)
+    logger.info(f"Using SHARED VectorStore instance")
     
-    graph = graph.compile()
+    graph = _compile_graph(nodes)
     logger.info("Graph compiled successfully with SHARED VectorStore")
     return graph
 
@@ -725,8 +1567,6 @@ def build_graph_with_vector_store(
 # =============================================================================
 
 if __name__ == "__main__":
-    import asyncio
-    
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
@@ -753,9 +1593,12 @@ if __name__ == "__main__":
             "generation": None,
             "retry_count": 0,
             "rewritten_query": None,
+            "prefetched_rewrite_docs": None,
+            "interactive": True,
+            "query_embedding": None,
         }
         
-        result = graph.invoke(initial_state)
+        result = asyncio.run(graph.ainvoke(initial_state))
         
         print("\n" + "=" * 60)
         print("RESULT")
@@ -763,7 +1606,6 @@ if __name__ == "__main__":
         print(f"Query: {result['query']}")
         print(f"Rewritten: {result.get('rewritten_query', 'N/A')}")
         print(f"Retries: {result['retry_count']}")
-        print(f"Docs Retrieved: {len(result['documents'])}")
         print(f"Docs Relevant: {len(result['relevant_documents'])}")
         print(f"\nGeneration:\n{result['generation']}")
         
@@ -5,6 +5,7 @@ Loads environment variables from .env file with strict validation.
 """
 
 from pathlib import Path
+from typing import Literal
 
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -29,6 +30,14 @@ class Settings(BaseSettings):
         default="gemini-2.0-flash",
         description="Gemini model to use for transcription",
     )
+    gemini_concurrency: int = Field(
+        default=8,
+        description="Maximum concurrent Gemini transcriptions during ingestion",
+    )
+    use_batch_api: bool = Field(
+        default=False,
+        description="Transcribe images through the Gemini Batch API (cheaper, slower)",
+    )
 
     # Groq Configuration (for chat/RAG)
     groq_api_key: str = Field(
@@ -53,6 +62,64 @@ class Settings(BaseSettings):
         default="pdf_documents",
         description="Qdrant collection name for storing documents",
     )
+    qdrant_batch_size: int = Field(
+        default=64,
+        description="Documents per batched embedding pass and Qdrant upsert during ingestion",
+    )
+
+    # Grading Configuration (Qdrant cosine bands that bypass LLM grading)
+    grade_cosine_accept: float = Field(
+        default=0.55,
+        description="Cosine score above which a document is accepted without LLM grading",
+    )
+    grade_cosine_reject: float = Field(
+        default=0.25,
+        description="Cosine score below which a document is rejected without LLM grading",
+    )
+
+    # PDF Parsing Configuration
+    pdf_high_fidelity: bool = Field(
+        default=False,
+        description="Use docling's native PDF backend instead of pypdfium2",
+    )
+    pdf_keep_converter_warm: bool = Field(
+        default=False,
+        description="Parse PDFs in-process with a shared docling converter instead of a worker process",
+    )
+    pdf_extract_mode: Literal["text", "images", "both"] = Field(
+        default="both",
+        description="Extract only text, only tables/figures, or both from PDFs",
+    )
+    pdf_num_threads: int | None = Field(
+        default=None,
+        description="Threads for docling's models (default: all cores)",
+    )
+    pdf_device: str = Field(
+        default="auto",
+        description="Accelerator device for docling: auto, cpu, cuda or mps",
+    )
+    pdf_fast_tables: bool = Field(
+        default=True,
+        description="Use TableFormer's fast mode instead of accurate",
+    )
+    pdf_enable_ocr: bool = Field(
+        default=False,
+        description="Run OCR during PDF parsing (needed for scanned PDFs)",
+    )
+    pdf_image_format: Literal["png", "webp", "jpg"] = Field(
+        default="jpg",
+        description="File format for extracted figure and table images",
+    )
+    pdf_chunker: Literal["markdown", "hybrid"] = Field(
+        default="markdown",
+        description="Chunk exported markdown by characters, or the parsed document with docling's HybridChunker",
+    )
+
+    # Ingestion Configuration
+    max_parallel_pdfs: int = Field(
+        default=2,
+        description="Maximum PDFs ingested concurrently when given a directory",
+    )
 
     # Output Configuration
     output_dir: Path = Field(
@@ -6,7 +6,11 @@ Parses PDFs, transcribes tables/charts with Gemini, and stores in Qdrant.
 
 import argparse
 import asyncio
+import atexit
+import io
 import logging
+import logging.handlers
+import queue
 import sys
 from pathlib import Path
 
@@ -17,23 +21,117 @@ from backend.IngestScript.config.settings import get_settings
 from backend.IngestScript.services.gemini_transcriber import GeminiTranscriber
 from backend.IngestScript.services.vector_store import VectorStore, DocumentMetadata
 
+
+def _configure_logging() -> None:
+    """
+    Configure root logging through a queue.
+
+    Records are handed to a QueueHandler and written to stderr by a
+    QueueListener thread, so concurrent transcription tasks never block on
+    console I/O. Does nothing if the root logger is already configured
+    (e.g. when imported by the API server).
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(
+        "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    ))
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    listener.start()
+    atexit.register(listener.stop)
+
+
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+_configure_logging()
 logger = logging.getLogger(__name__)
 
 
 from typing import Callable, Any
 
+
+def _fallback_description(element) -> str:
+    """
+    Build a searchable description for a visual element whose transcription failed.
+
+    Args:
+        element: Parsed visual element.
+
+    Returns:
+        Description built from the heading, caption and page context.
+    """
+    # FALLBACK: Build RICH metadata from available context
+    # Include figure number (from heading), caption, and context for semantic matching
+    fallback_parts = []
+
+    # 1. Add figure identifier (e.g., "Figure 1")
+    if element.heading:
+        fallback_parts.append(f"[{element.heading}]")
+    else:
+        fallback_parts.append(f"[{element.element_type.value.upper()} - Page {element.page_number}]")
+
+    # 2. Add caption/content which now includes rich metadata from parser
+    if element.content and element.content.strip():
+        fallback_parts.append(element.content.strip())
+
+    # 3. Add searchable metadata
+    fallback_parts.append(f"Visual element from Page {element.page_number}.")
+    fallback_parts.append(f"Image file: {element.image_path.name}")
+
+    return " ".join(filter(None, fallback_parts))
+
+
+def _store_documents(
+    vector_store: VectorStore,
+    metadata_list: list[DocumentMetadata],
+    batch_size: int = 32,
+) -> int:
+    """
+    Store documents in Qdrant in batches, logging (not raising) failures.
+
+    A batch that fails to store is retried one document at a time so a
+    single bad document does not drop the rest.
+
+    Args:
+        vector_store: Qdrant vector store service.
+        metadata_list: Documents to store.
+        batch_size: Documents per embedding pass and upsert.
+
+    Returns:
+        Number of documents stored.
+    """
+    stored = 0
+    for start in range(0, len(metadata_list), batch_size):
+        batch = metadata_list[start:start + batch_size]
+        try:
+            stored += len(vector_store.upsert_documents(batch))
+            continue
+        except Exception as e:
+            logger.error(f"Batch upsert of {len(batch)} documents failed, storing individually: {e}")
+        for metadata in batch:
+            try:
+                doc_id = vector_store.upsert_document(metadata)
+                stored += 1
+                logger.info(f"Stored {metadata.element_type} in Qdrant with ID: {doc_id}")
+            except Exception as e:
+                logger.error(f"Failed to store {metadata.element_type} in Qdrant: {e}")
+    return stored
+
+
 async def process_pdf(
     pdf_path: Path,
     output_dir: Path,
     transcriber: GeminiTranscriber,
     vector_store: VectorStore,
     progress_callback: Callable[[dict[str, Any]], None] | None = None,
+    gemini_semaphore: asyncio.Semaphore | None = None,
 ) -> dict:
     """
     Process a single PDF file.
@@ -44,6 +142,9 @@ async def process_pdf(
         transcriber: Gemini transcriber service.
         vector_store: Qdrant vector store service.
         progress_callback: Optional callback for progress updates.
+        gemini_semaphore: Bounds concurrent Gemini transcriptions; share one
+            across concurrently processed PDFs. Defaults to a new semaphore
+            of settings.gemini_concurrency slots.
 
     Returns:
         Processing statistics.
@@ -57,17 +158,31 @@ async def process_pdf(
         "tables": 0,
         "figures": 0,
         "corrections": 0,
+        "verifications_skipped": 0,
+        "fallbacks": 0,
         "stored": 0,
     }
 
-    # Collect all text for summary generation
-    all_text_content: list[str] = []
+    # Collect text for summary generation; only the leading preview is used
+    text_buf = io.StringIO()
 
     # Parse PDF (Step 1)
     if progress_callback:
         progress_callback({"status": "parsing", "message": "Parsing PDF structure...", "progress": 5})
 
-    parser = PDFParser(output_dir=output_dir)
+    settings = get_settings()
+    parser = PDFParser(
+        output_dir=output_dir,
+        keep_converter_warm=settings.pdf_keep_converter_warm,
+        use_high_fidelity=settings.pdf_high_fidelity,
+        mode=settings.pdf_extract_mode,
+        num_threads=settings.pdf_num_threads,
+        device=settings.pdf_device,
+        fast_table_mode=settings.pdf_fast_tables,
+        enable_ocr=settings.pdf_enable_ocr,
+        image_format=settings.pdf_image_format,
+        chunker=settings.pdf_chunker,
+    )
     # Run synchronous parsing in a thread to avoid blocking the event loop
     elements = await asyncio.to_thread(parser.parse, pdf_path)
     stats["total_elements"] = len(elements)
@@ -81,134 +196,184 @@ async def process_pdf(
             progress_callback({"status": "completed", "message": "No content extracted from PDF", "progress": 100})
         return stats
 
-    for i, element in enumerate(elements):
-        # Calculate progress (10% to 85%)
-        current_progress = 10 + int((i / max(total, 1)) * 75)
-        
-        if progress_callback:
-            progress_callback({
-                "status": "processing", 
-                "message": f"Processing element {i+1}/{total} (Page {element.page_number})", 
-                "progress": current_progress,
-                "current": i + 1,
-                "total": total
-            })
-
+    text_elements = []
+    image_elements = []
+    for element in elements:
         if element.element_type == ElementType.TABLE:
             stats["tables"] += 1
         elif element.element_type == ElementType.FIGURE:
             stats["figures"] += 1
 
-        # Handle Text Elements (No Transcription/Image needed)
         if element.element_type == ElementType.TEXT:
-            if not element.content:
-                continue
-                
-            logger.info(f"Processing Text Element (Page {element.page_number})")
-            
-            # Collect text for summary
-            all_text_content.append(element.content)
-            
-            # Store directly in Qdrant
-            metadata = DocumentMetadata(
-                shadow_text=element.content,
-                original_image_path=None, # Text elements have no image
-                element_type=element.element_type.value,
-                source_pdf=str(pdf_path.absolute()),
-                page_number=element.page_number,
-            )
-
-            try:
-                doc_id = vector_store.upsert_document(metadata)
-                stats["stored"] += 1
-                stats["text_chunks"] += 1
-                logger.info(f"Stored Text Chunk in Qdrant with ID: {doc_id}")
-            except Exception as e:
-                logger.error(f"Failed to store text in Qdrant: {e}")
-            
-            continue # Done with this element
-
-        # Skip non-text elements without images
-        if element.image_path is None:
+            if element.content:
+                text_elements.append(element)
+        elif element.image_path is None:
+            # Skip non-text elements without images
             logger.warning(f"Skipping element without image: {element}")
-            continue
+        else:
+            image_elements.append(element)
 
-        # RATE LIMITING: Add delay between Gemini API calls to respect free tier limits
-        # Gemini free tier: 15 requests/min, 1M tokens/min, 1500 requests/day
-        # Using 65 seconds to ensure quota fully resets before each call
-        GEMINI_DELAY_SECONDS = 65
-        if stats["figures"] > 0 or stats["tables"] > 0:  # Delay after first visual element
-            logger.info(f"⏳ Waiting {GEMINI_DELAY_SECONDS}s for Gemini quota to reset...")
-            await asyncio.sleep(GEMINI_DELAY_SECONDS)
+    source_pdf = str(pdf_path.absolute())
 
+    # Handle Text Elements (No Transcription/Image needed) - stored in a
+    # worker thread while the image transcriptions run
+    text_metadata = [
+        DocumentMetadata(
+            shadow_text=element.content,
+            original_image_path=None,  # Text elements have no image
+            element_type=element.element_type.value,
+            source_pdf=source_pdf,
+            page_number=element.page_number,
+        )
+        for element in text_elements
+    ]
+    text_store_task = asyncio.create_task(
+        asyncio.to_thread(
+            _store_documents, vector_store, text_metadata, settings.qdrant_batch_size
+        )
+    )
 
-        # Transcribe with verification
-        logger.info(f"Transcribing {element.element_type.value} on page {element.page_number}...")
-        
-        transcription_text = None
-        try:
-            result = await transcriber.transcribe_with_verification(element.image_path)
-            transcription_text = result.verified_transcription
-            if result.was_corrected:
-                stats["corrections"] += 1
-                logger.info("✓ Self-correction applied")
-        except Exception as e:
-            logger.error(f"Transcription failed for {element.image_path}: {e}")
-            # FALLBACK: Build RICH metadata from available context
-            # Include figure number (from heading), caption, and context for semantic matching
-            fallback_parts = []
-            
-            # 1. Add figure identifier (e.g., "Figure 1")
-            if element.heading:
-                fallback_parts.append(f"[{element.heading}]")
-            else:
-                fallback_parts.append(f"[{element.element_type.value.upper()} - Page {element.page_number}]")
-            
-            # 2. Add caption/content which now includes rich metadata from parser
-            if element.content and element.content.strip():
-                fallback_parts.append(element.content.strip())
-            
-            # 3. Add searchable metadata
-            fallback_parts.append(f"Visual element from Page {element.page_number}.")
-            fallback_parts.append(f"Image file: {element.image_path.name}")
-            
-            transcription_text = " ".join(filter(None, fallback_parts))
+    total_images = len(image_elements)
+    done = 0
+    # Progress runs from 10% to 85% over the visual elements; updates are
+    # sent only when the integer percentage moves (and for the last element)
+    progress_step = 75.0 / max(total_images, 1)
+    last_progress = -1
+
+    def to_shadow_text(element, result) -> str:
+        """Turn a transcription result (or its exception) into shadow text."""
+        if isinstance(result, BaseException):
+            logger.error(f"Transcription failed for {element.image_path}: {result}")
+            stats["fallbacks"] += 1
+            transcription_text = _fallback_description(element)
             logger.info(f"Using fallback description for {element.element_type.value}: {transcription_text[:100]}...")
+            return transcription_text
+        if result.verification_skipped:
+            stats["verifications_skipped"] += 1
+        if result.was_corrected:
+            stats["corrections"] += 1
+            logger.info("✓ Self-correction applied")
+        return result.verified_transcription
+
+    def report(element) -> None:
+        nonlocal done, last_progress
+        done += 1
+        if not progress_callback:
+            return
+        progress = 10 + int(done * progress_step)
+        if progress == last_progress and done != total_images:
+            return
+        last_progress = progress
+        progress_callback({
+            "status": "processing",
+            "message": f"Transcribed visual element {done}/{total_images} (Page {element.page_number})",
+            "progress": progress,
+            "current": done,
+            "total": total_images,
+        })
+
+    # Transcribe all visual elements concurrently, bounded by a semaphore
+    # to respect Gemini rate limits
+    semaphore = gemini_semaphore or asyncio.Semaphore(settings.gemini_concurrency)
+
+    async def transcribe_one(element, image_data: bytes | None) -> str:
+        """Transcribe one element; releases the slot taken by transcribe_all."""
+        try:
+            logger.info(f"Transcribing {element.element_type.value} on page {element.page_number}...")
+            try:
+                result = await transcriber.transcribe_with_verification(element.image_path, image_data)
+            except Exception as e:
+                result = e
+        finally:
+            semaphore.release()
+        transcription_text = to_shadow_text(element, result)
+        report(element)
+        return transcription_text
+
+    async def transcribe_all() -> list[str]:
+        """Start a transcription per free slot, reading the next image meanwhile."""
+        tasks = []
+        remaining = iter(image_elements)
+        async for image_data in transcriber.iter_with_prefetched_bytes(
+            [el.image_path for el in image_elements]
+        ):
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(transcribe_one(next(remaining), image_data)))
+        return await asyncio.gather(*tasks)
 
-
-
-        # Collect transcription for summary
-        all_text_content.append(transcription_text)
-
+    if progress_callback:
+        progress_callback({
+            "status": "processing",
+            "message": f"Processing {len(text_elements)} text chunks and {total_images} visual elements",
+            "progress": 10,
+            "current": 0,
+            "total": total_images,
+        })
+
+    if settings.use_batch_api and image_elements:
+        # Offline path: one Gemini Batch job for all images
+        logger.info(f"Submitting {total_images} visual elements to the Gemini Batch API...")
+        try:
+            results = await transcriber.transcribe_batch([el.image_path for el in image_elements])
+        except Exception as e:
+            results = [e] * total_images
+        transcriptions = []
+        for element, result in zip(image_elements, results):
+            transcriptions.append(to_shadow_text(element, result))
+            report(element)
+    else:
+        transcriptions = await transcribe_all()
+
+    image_metadata = []
+    for element, transcription_text in zip(image_elements, transcriptions):
         # Log the shadow text
-        logger.info(f"--- Shadow Text ({element.element_type.value}) ---")
-        logger.info(f"\n{transcription_text}\n")
-        logger.info("--- End Shadow Text ---")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"--- Shadow Text ({element.element_type.value}) ---\n"
+                f"{transcription_text}\n--- End Shadow Text ---"
+            )
 
         # Store in Qdrant - ALWAYS store figures, even with fallback text
-        metadata = DocumentMetadata(
+        image_metadata.append(DocumentMetadata(
             shadow_text=transcription_text,
             original_image_path=str(element.image_path.absolute()),
             element_type=element.element_type.value,
-            source_pdf=str(pdf_path.absolute()),
+            source_pdf=source_pdf,
             page_number=element.page_number,
-        )
+        ))
 
-        try:
-            doc_id = vector_store.upsert_document(metadata)
-            stats["stored"] += 1
-            logger.info(f"Stored {element.element_type.value} in Qdrant with ID: {doc_id}")
-        except Exception as e:
-            logger.error(f"Failed to store in Qdrant: {e}")
+    text_stored = await text_store_task
+    stats["text_chunks"] += text_stored
+    stats["stored"] += text_stored
+    stats["stored"] += await asyncio.to_thread(
+        _store_documents, vector_store, image_metadata, settings.qdrant_batch_size
+    )
+
+    # Collect text and transcriptions for summary, in document order, until
+    # the summary preview is filled
+    shadow_texts = {id(el): text for el, text in zip(image_elements, transcriptions)}
+    summary_budget = transcriber.SUMMARY_PREVIEW_CHARS
+    for element in elements:
+        if text_buf.tell() >= summary_budget:
+            break
+        if element.element_type == ElementType.TEXT:
+            content = element.content
+        else:
+            content = shadow_texts.get(id(element))
+        if content:
+            if text_buf.tell():
+                text_buf.write("\n\n")
+            # Copy only the part of the chunk that fits in the preview
+            text_buf.write(content[:summary_budget - text_buf.tell()])
 
 
     # Generate and store global summary (Step 2)
-    if all_text_content:
+    if text_buf.tell():
         if progress_callback:
             progress_callback({"status": "summarizing", "message": "Generating document summary...", "progress": 90})
         
         try:
-            full_text = "\n\n".join(all_text_content)
+            full_text = text_buf.getvalue()
             summary = await transcriber.generate_summary(full_text)
             
             # Store summary as a special chunk
@@ -242,7 +407,7 @@ async def main() -> None:
         "--pdf-path",
         type=Path,
         required=True,
-        help="Path to the PDF file to ingest",
+        help="Path to the PDF file to ingest, or a directory of PDFs",
     )
     parser.add_argument(
         "--output-dir",
@@ -277,7 +442,18 @@ async def main() -> None:
     logger.info("=" * 60)
     logger.info("Agentic RAG Pipeline - PDF Ingestion")
     logger.info("=" * 60)
-    logger.info(f"PDF Path: {args.pdf_path}")
+    # Resolve the PDFs to ingest
+    pdf_path = args.pdf_path.resolve()
+    if pdf_path.is_dir():
+        # Match .pdf in any case, like the API upload check
+        pdf_paths = sorted(p for p in pdf_path.iterdir() if p.suffix.lower() == ".pdf")
+    else:
+        pdf_paths = [pdf_path]
+    if not pdf_paths:
+        logger.error(f"No PDF files found in: {pdf_path}")
+        sys.exit(1)
+
+    logger.info(f"PDF Path: {args.pdf_path} ({len(pdf_paths)} file(s))")
     logger.info(f"Output Dir: {output_dir}")
     logger.info(f"Gemini Model: {settings.gemini_model}")
     logger.info(f"Qdrant: {settings.qdrant_host}:{settings.qdrant_port}")
@@ -295,33 +471,56 @@ async def main() -> None:
         collection_name=settings.qdrant_collection_name,
     )
 
-    # Process PDF
-    try:
-        stats = await process_pdf(
-            pdf_path=args.pdf_path.resolve(),
-            output_dir=output_dir,
-            transcriber=transcriber,
-            vector_store=vector_store,
-        )
-    except FileNotFoundError as e:
-        logger.error(str(e))
-        sys.exit(1)
-    except Exception as e:
-        logger.exception(f"Processing failed: {e}")
+    # Process PDFs concurrently, sharing the services, up to
+    # max_parallel_pdfs at a time
+    semaphore = asyncio.Semaphore(settings.max_parallel_pdfs)
+    # One Gemini limit for all PDFs, not gemini_concurrency per PDF
+    gemini_semaphore = asyncio.Semaphore(settings.gemini_concurrency)
+
+    async def process_one(path: Path) -> dict | None:
+        async with semaphore:
+            try:
+                return await process_pdf(
+                    pdf_path=path,
+                    output_dir=output_dir,
+                    transcriber=transcriber,
+                    vector_store=vector_store,
+                    gemini_semaphore=gemini_semaphore,
+                )
+            except FileNotFoundError as e:
+                logger.error(str(e))
+            except Exception as e:
+                logger.exception(f"Processing failed for {path.name}: {e}")
+            return None
+
+    results = await asyncio.gather(*(process_one(path) for path in pdf_paths))
+    failed = sum(1 for result in results if result is None)
+    if failed == len(pdf_paths):
         sys.exit(1)
 
+    stats: dict[str, int] = {}
+    for result in results:
+        for key, value in (result or {}).items():
+            stats[key] = stats.get(key, 0) + value
+
     # Print summary
     logger.info("=" * 60)
     logger.info("INGESTION COMPLETE")
     logger.info("=" * 60)
+    logger.info(f"PDFs Processed: {len(pdf_paths) - failed}/{len(pdf_paths)}")
     logger.info(f"Total Elements: {stats['total_elements']}")
     logger.info(f"  Tables: {stats['tables']}")
     logger.info(f"  Figures: {stats['figures']}")
     logger.info(f"Self-Corrections: {stats['corrections']}")
+    logger.info(f"Verifications Skipped: {stats['verifications_skipped']}")
+    logger.info(f"Fallback Descriptions: {stats['fallbacks']}")
     logger.info(f"Stored in Qdrant: {stats['stored']}")
     logger.info(f"Total in Collection: {vector_store.count_documents()}")
     logger.info("=" * 60)
 
+    if failed:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     asyncio.run(main())
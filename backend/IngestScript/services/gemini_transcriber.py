@@ -4,8 +4,12 @@ Gemini Transcriber service.
 Uses Gemini 2.0 Flash to transcribe tables/charts to Markdown with self-correction.
 """
 
+import asyncio
 import base64
+import io
+import json
 import logging
+from collections.abc import AsyncIterator
 from pathlib import Path
 from dataclasses import dataclass
 
@@ -43,6 +47,48 @@ Instructions:
 
 Return ONLY the final description (corrected if needed), no explanations."""
 
+COMBINED_PROMPT = TRANSCRIPTION_PROMPT + """
+
+Work in three steps:
+1. Draft the description as instructed above.
+2. Rate your confidence, from 0 to 1, that the draft mentions ALL visible elements, labels and structures and spells technical terms and proper names correctly.
+3. If confidence is 0.9 or higher, leave final empty - the draft stands. Otherwise critically re-examine the image against your draft, add any missing details, fix any errors and put the corrected version in final.
+
+Respond with JSON: {"draft": "...", "confidence": 0.0-1.0, "final": "..."}"""
+
+# Variant for large images, where a missed detail is likelier: the model
+# always re-examines the image and fills final
+COMBINED_FULL_PROMPT = TRANSCRIPTION_PROMPT + """
+
+Work in three steps:
+1. Draft the description as instructed above.
+2. Rate your confidence, from 0 to 1, that the draft mentions ALL visible elements, labels and structures and spells technical terms and proper names correctly.
+3. Critically re-examine the image against your draft, add any missing details, fix any errors and put the corrected version in final (repeat the draft if nothing needs changing).
+
+Respond with JSON: {"draft": "...", "confidence": 0.0-1.0, "final": "..."}"""
+
+# Response schema for COMBINED_PROMPT and COMBINED_FULL_PROMPT (Gemini JSON mode)
+COMBINED_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "draft": {"type": "STRING"},
+        "confidence": {"type": "NUMBER"},
+        "final": {"type": "STRING"},
+    },
+    "required": ["draft", "confidence", "final"],
+    "propertyOrdering": ["draft", "confidence", "final"],
+}
+
+
+
+# Image MIME types by lowercase file extension
+_MIME_TYPES: dict[str, str] = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+}
 
 
 @dataclass
@@ -52,11 +98,34 @@ class TranscriptionResult:
     verified_transcription: str
     was_corrected: bool
     image_path: Path
+    verification_skipped: bool = False
 
 
 class GeminiTranscriber:
     """Service for transcribing images using Gemini 2.0 Flash."""
 
+    # Batch API polling (seconds, doubled up to the max)
+    BATCH_POLL_INTERVAL = 10.0
+    BATCH_POLL_MAX_INTERVAL = 300.0
+    BATCH_TERMINAL_STATES = (
+        "JOB_STATE_SUCCEEDED",
+        "JOB_STATE_FAILED",
+        "JOB_STATE_CANCELLED",
+        "JOB_STATE_EXPIRED",
+    )
+    # Trust a confident draft without a correction pass, for images small
+    # enough that a missed detail is unlikely
+    VERIFY_SKIP_CONFIDENCE = 0.9
+    VERIFY_SKIP_MAX_BYTES = 500_000
+    # Leading characters of the document used as its summary
+    SUMMARY_PREVIEW_CHARS = 1500
+    # Rate-limit (429) retries: wait the server's retryDelay when given,
+    # else back off doubling from the base; 2+4+8+16+32s outlasts the
+    # per-minute quota window. Each wait is capped (seconds)
+    RATE_LIMIT_RETRIES = 5
+    RATE_LIMIT_BACKOFF = 2.0
+    RATE_LIMIT_MAX_DELAY = 65.0
+
     def __init__(self, api_key: str, model_name: str = "gemini-2.0-flash") -> None:
         """
         Initialize the Gemini transcriber.
@@ -73,29 +142,113 @@ class GeminiTranscriber:
         self.genai_types = None  # Will be loaded on first use
         logger.info(f"Initialized Gemini transcriber with model: {model_name}")
 
-    def _load_image_as_base64(self, image_path: Path) -> str:
-        """Load an image file and return base64 encoded string."""
-        with open(image_path, "rb") as f:
-            return base64.b64encode(f.read()).decode("utf-8")
+    def _load_image_bytes(self, image_path: Path) -> bytes:
+        """Load an image file as raw bytes."""
+        return image_path.read_bytes()
 
     def _get_mime_type(self, image_path: Path) -> str:
         """Get MIME type based on file extension."""
-        suffix = image_path.suffix.lower()
-        mime_types = {
-            ".png": "image/png",
-            ".jpg": "image/jpeg",
-            ".jpeg": "image/jpeg",
-            ".webp": "image/webp",
-            ".gif": "image/gif",
-        }
-        return mime_types.get(suffix, "image/png")
-
-    async def transcribe(self, image_path: Path) -> str:
+        return _MIME_TYPES.get(image_path.suffix.lower(), "image/png")
+
+    async def iter_with_prefetched_bytes(
+        self, image_paths: list[Path]
+    ) -> AsyncIterator[bytes | None]:
+        """
+        Yield each image's bytes, reading the next file while the caller works.
+
+        The read of image i+1 is started on a worker thread before image i
+        is yielded, so disk I/O overlaps with the caller's Gemini requests.
+
+        Args:
+            image_paths: Paths to the image files.
+
+        Yields:
+            Image bytes in input order, or None if a file could not be read
+            (transcribe_with_verification then reads it itself and reports
+            the error).
+        """
+        if not image_paths:
+            return
+
+        pending = asyncio.create_task(asyncio.to_thread(self._load_image_bytes, image_paths[0]))
+        try:
+            for i, image_path in enumerate(image_paths):
+                current = pending
+                if i + 1 < len(image_paths):
+                    pending = asyncio.create_task(
+                        asyncio.to_thread(self._load_image_bytes, image_paths[i + 1])
+                    )
+                try:
+                    image_data = await current
+                except OSError as e:
+                    logger.warning(f"Failed to prefetch {image_path}: {e}")
+                    image_data = None
+                yield image_data
+        finally:
+            pending.cancel()
+
+    @staticmethod
+    def _is_rate_limited(error: Exception) -> bool:
+        """Return True if a Gemini error is a 429 / quota exhaustion."""
+        return getattr(error, "code", None) == 429 or type(error).__name__ == "ResourceExhausted"
+
+    @staticmethod
+    def _retry_delay(error: Exception) -> float | None:
+        """
+        Read the retryDelay Gemini attaches to a 429 error, if any.
+
+        Args:
+            error: The rate-limit error.
+
+        Returns:
+            The suggested wait in seconds, or None if absent or unparseable.
+        """
+        details = getattr(error, "details", None)
+        if isinstance(details, dict):
+            details = details.get("error", details).get("details")
+        for detail in details if isinstance(details, list) else ():
+            delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+            if isinstance(delay, str) and delay.endswith("s"):
+                try:
+                    return float(delay[:-1])
+                except ValueError:
+                    return None
+        return None
+
+    async def _generate_content(self, **kwargs):
+        """
+        Call Gemini's generate_content, retrying rate-limited requests.
+
+        Args:
+            **kwargs: Passed through to client.aio.models.generate_content.
+
+        Returns:
+            The Gemini response.
+
+        Raises:
+            Exception: The last rate-limit error once retries are exhausted,
+                or any other API error immediately.
+        """
+        for attempt in range(self.RATE_LIMIT_RETRIES + 1):
+            try:
+                return await self.client.aio.models.generate_content(**kwargs)
+            except Exception as e:
+                if attempt == self.RATE_LIMIT_RETRIES or not self._is_rate_limited(e):
+                    raise
+                delay = self._retry_delay(e)
+                if delay is None:
+                    delay = self.RATE_LIMIT_BACKOFF * 2 ** attempt
+                delay = min(delay, self.RATE_LIMIT_MAX_DELAY)
+                logger.warning(f"Gemini rate limited, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def transcribe(self, image_path: Path, image_data: bytes | None = None) -> str:
         """
         Transcribe an image to Markdown.
 
         Args:
             image_path: Path to the image file.
+            image_data: Image bytes already read from image_path, if any.
 
         Returns:
             Markdown transcription of the image content.
@@ -105,17 +258,18 @@ class GeminiTranscriber:
         # Lazy-load types
         from google.genai import types
 
-        image_data = self._load_image_as_base64(image_path)
+        if image_data is None:
+            image_data = await asyncio.to_thread(self._load_image_bytes, image_path)
         mime_type = self._get_mime_type(image_path)
 
-        response = await self.client.aio.models.generate_content(
+        response = await self._generate_content(
             model=self.model_name,
             contents=[
                 types.Content(
                     role="user",
                     parts=[
                         types.Part.from_bytes(
-                            data=base64.b64decode(image_data),
+                            data=image_data,
                             mime_type=mime_type,
                         ),
                         types.Part.from_text(text=TRANSCRIPTION_PROMPT),
@@ -128,13 +282,16 @@ class GeminiTranscriber:
         logger.debug(f"Initial transcription:\n{transcription}")
         return transcription
 
-    async def verify(self, image_path: Path, transcription: str) -> str:
+    async def verify(
+        self, image_path: Path, transcription: str, image_data: bytes | None = None
+    ) -> str:
         """
         Verify and correct a transcription against the original image.
 
         Args:
             image_path: Path to the original image.
             transcription: The transcription to verify.
+            image_data: Image bytes already read from image_path, if any.
 
         Returns:
             Verified (and possibly corrected) transcription.
@@ -144,19 +301,20 @@ class GeminiTranscriber:
         # Lazy-load types
         from google.genai import types
 
-        image_data = self._load_image_as_base64(image_path)
+        if image_data is None:
+            image_data = await asyncio.to_thread(self._load_image_bytes, image_path)
         mime_type = self._get_mime_type(image_path)
 
         prompt = VERIFICATION_PROMPT.format(transcription=transcription)
 
-        response = await self.client.aio.models.generate_content(
+        response = await self._generate_content(
             model=self.model_name,
             contents=[
                 types.Content(
                     role="user",
                     parts=[
                         types.Part.from_bytes(
-                            data=base64.b64decode(image_data),
+                            data=image_data,
                             mime_type=mime_type,
                         ),
                         types.Part.from_text(text=prompt),
@@ -170,29 +328,83 @@ class GeminiTranscriber:
         return verified
 
     async def transcribe_with_verification(
-        self, image_path: Path
+        self, image_path: Path, image_data: bytes | None = None
     ) -> TranscriptionResult:
         """
         Transcribe an image and verify the result with self-correction.
 
-        This implements a two-pass approach:
-        1. Initial transcription
-        2. Verification pass that can correct errors
+        The draft, a self-reported confidence and a corrected final
+        description are produced in a single Gemini call returning JSON.
+        For small images the model leaves final empty when it is
+        confident, and the draft is accepted without verification; large
+        images get a prompt that always fills final. Only a small image
+        left unverified without confidence gets a separate verify call. If
+        the response cannot be parsed, falls back to separate transcribe
+        and verify calls.
 
         Args:
             image_path: Path to the image file.
+            image_data: Image bytes already read from image_path, if any.
 
         Returns:
             TranscriptionResult with original and verified transcriptions.
         """
-        # Phase 1: Initial transcription
-        original = await self.transcribe(image_path)
+        logger.info(f"Transcribing and verifying image: {image_path}")
+
+        # Lazy-load types
+        from google.genai import types
+
+        # Read once; reused by the two-pass fallback
+        if image_data is None:
+            image_data = await asyncio.to_thread(self._load_image_bytes, image_path)
+        large = len(image_data) >= self.VERIFY_SKIP_MAX_BYTES
+
+        response = await self._generate_content(
+            model=self.model_name,
+            contents=[
+                types.Content(
+                    role="user",
+                    parts=[
+                        types.Part.from_bytes(
+                            data=image_data,
+                            mime_type=self._get_mime_type(image_path),
+                        ),
+                        types.Part.from_text(
+                            text=COMBINED_FULL_PROMPT if large else COMBINED_PROMPT
+                        ),
+                    ],
+                )
+            ],
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=COMBINED_SCHEMA,
+            ),
+        )
 
-        # Phase 2: Self-correction verification
-        verified = await self.verify(image_path, original)
+        skipped = False
+        try:
+            data = json.loads(response.text)
+            original = data["draft"].strip()
+            verified = data["final"].strip()
+            confidence = float(data.get("confidence") or 0.0)
+        except (TypeError, ValueError, KeyError, AttributeError) as e:
+            logger.warning(f"Combined transcription unparseable ({e}), using two-pass path for: {image_path}")
+            original = await self.transcribe(image_path, image_data)
+            verified = await self.verify(image_path, original, image_data)
+        else:
+            if not verified:
+                if large:
+                    # Asked to always fill final; an empty one means no changes
+                    verified = original
+                elif confidence >= self.VERIFY_SKIP_CONFIDENCE:
+                    verified = original
+                    skipped = True
+                    logger.info(f"Skipping verification (confidence {confidence:.2f}) for: {image_path}")
+                else:
+                    verified = await self.verify(image_path, original, image_data)
 
         # Detect if correction was made
-        was_corrected = original.strip() != verified.strip()
+        was_corrected = original != verified
 
         if was_corrected:
             logger.info(f"Transcription was corrected for: {image_path}")
@@ -204,7 +416,125 @@ class GeminiTranscriber:
             verified_transcription=verified,
             was_corrected=was_corrected,
             image_path=image_path,
+            verification_skipped=skipped,
+        )
+
+    def _build_batch_jsonl(self, image_paths: list[Path]) -> bytes:
+        """
+        Build the Batch API input file: one combined request per image.
+
+        Large images get COMBINED_FULL_PROMPT, as in
+        transcribe_with_verification; the rest get COMBINED_PROMPT.
+
+        Args:
+            image_paths: Paths to the image files.
+
+        Returns:
+            JSONL file content, keyed by image index.
+        """
+        lines = []
+        for i, path in enumerate(image_paths):
+            image_data = self._load_image_bytes(path)
+            large = len(image_data) >= self.VERIFY_SKIP_MAX_BYTES
+            lines.append(json.dumps({
+                "key": str(i),
+                "request": {
+                    "contents": [{
+                        "role": "user",
+                        "parts": [
+                            {"inlineData": {
+                                "mimeType": self._get_mime_type(path),
+                                "data": base64.b64encode(image_data).decode("ascii"),
+                            }},
+                            {"text": COMBINED_FULL_PROMPT if large else COMBINED_PROMPT},
+                        ],
+                    }],
+                    "generationConfig": {
+                        "responseMimeType": "application/json",
+                        "responseSchema": COMBINED_SCHEMA,
+                    },
+                },
+            }))
+        return "\n".join(lines).encode("utf-8")
+
+    async def transcribe_batch(
+        self, image_paths: list[Path]
+    ) -> list[TranscriptionResult | Exception]:
+        """
+        Transcribe and verify many images through the Gemini Batch API.
+
+        Writes one COMBINED_PROMPT request per image to a JSONL file,
+        uploads it, submits a batch job and polls until it finishes.
+        Batch requests are billed at a discount and are not subject to
+        per-request rate limits, at the cost of latency.
+
+        Args:
+            image_paths: Paths to the image files.
+
+        Returns:
+            One TranscriptionResult per image, in order; an exception for
+            any image whose request failed.
+
+        Raises:
+            RuntimeError: If the batch job does not succeed.
+        """
+        if not image_paths:
+            return []
+
+        # Lazy-load types
+        from google.genai import types
+
+        # Reading and encoding every image is blocking work
+        jsonl = await asyncio.to_thread(self._build_batch_jsonl, image_paths)
+
+        uploaded = await self.client.aio.files.upload(
+            file=io.BytesIO(jsonl),
+            config=types.UploadFileConfig(mime_type="jsonl", display_name="transcription-batch"),
         )
+        job = await self.client.aio.batches.create(model=self.model_name, src=uploaded.name)
+        logger.info(f"Submitted Gemini batch {job.name} with {len(image_paths)} images")
+
+        delay = self.BATCH_POLL_INTERVAL
+        while job.state.name not in self.BATCH_TERMINAL_STATES:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.BATCH_POLL_MAX_INTERVAL)
+            job = await self.client.aio.batches.get(name=job.name)
+
+        if job.state.name != "JOB_STATE_SUCCEEDED" or not job.dest or not job.dest.file_name:
+            raise RuntimeError(f"Gemini batch {job.name} ended with state {job.state.name}")
+
+        output = await self.client.aio.files.download(file=job.dest.file_name)
+
+        results: list[TranscriptionResult | Exception] = [
+            RuntimeError("Missing batch result") for _ in image_paths
+        ]
+        for line in output.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            idx = int(record["key"])
+            try:
+                if "error" in record:
+                    raise RuntimeError(f"Batch request failed: {record['error']}")
+                text = record["response"]["candidates"][0]["content"]["parts"][0]["text"]
+                data = json.loads(text)
+                original = data["draft"].strip()
+                final = data["final"].strip()
+            except Exception as e:
+                results[idx] = e
+                continue
+            # No follow-up verify call in batch mode; an empty final means
+            # the model stood by its draft
+            results[idx] = TranscriptionResult(
+                original_transcription=original,
+                verified_transcription=final or original,
+                was_corrected=bool(final) and final != original,
+                image_path=image_paths[idx],
+                verification_skipped=not final,
+            )
+
+        logger.info(f"Gemini batch {job.name} completed")
+        return results
 
     async def generate_summary(self, full_text: str) -> str:
         """
@@ -219,7 +549,7 @@ class GeminiTranscriber:
         logger.info("Generating local preview summary (no API call)...")
 
         # Take first 1,500 characters as preview
-        preview = full_text[:1500].strip()
+        preview = full_text[:self.SUMMARY_PREVIEW_CHARS].strip()
         
         summary = f"DOCUMENT PREVIEW / EXECUTIVE SUMMARY:\n{preview}"
         
@@ -5,37 +5,37 @@ Stores document vectors with Shadow Text metadata using real embeddings.
 """
 
 import logging
+import platform
 import uuid
+from collections import OrderedDict
+from collections.abc import Iterator
+from dataclasses import dataclass
 
 from qdrant_client import QdrantClient
 from qdrant_client.models import (
     Distance,
+    PayloadSelectorInclude,
     PointStruct,
+    Prefetch,
+    QueryRequest,
     VectorParams,
 )
+import torch
 from sentence_transformers import SentenceTransformer
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(slots=True, frozen=True)
 class DocumentMetadata:
     """Metadata for a document element stored in Qdrant."""
     
-    def __init__(
-        self,
-        shadow_text: str,
-        original_image_path: str | None,
-        element_type: str,
-        source_pdf: str,
-        page_number: int,
-        keywords: str | None = None,
-    ) -> None:
-        self.shadow_text = shadow_text
-        self.original_image_path = original_image_path
-        self.element_type = element_type
-        self.source_pdf = source_pdf
-        self.page_number = page_number
-        self.keywords = keywords
+    shadow_text: str
+    original_image_path: str | None
+    element_type: str
+    source_pdf: str
+    page_number: int
+    keywords: str | None = None
 
 
 class VectorStore:
@@ -44,6 +44,21 @@ class VectorStore:
     # all-MiniLM-L6-v2 outputs 384-dim vectors
     VECTOR_DIM = 384
     EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+    # INT8-quantized ONNX exports shipped in the model repo (same 384-dim
+    # output), each tuned for one instruction set; see _onnx_model_file
+    ONNX_MODEL_FILES = {
+        "arm64": "onnx/model_qint8_arm64.onnx",
+        "avx512_vnni": "onnx/model_qint8_avx512_vnni.onnx",
+        "avx2": "onnx/model_quint8_avx2.onnx",
+    }
+    # Candidate pool fetched server-side before the final top-k rescoring
+    PREFETCH_LIMIT = 40
+    # Leading slice of shadow_text stored separately for lightweight retrieval
+    PREVIEW_CHARS = 1600
+    # Texts per forward pass when embedding documents in bulk
+    EMBED_BATCH_SIZE = 64
+    # Query embeddings kept in memory (LRU); ~1.5 KB each
+    QUERY_CACHE_SIZE = 1024
 
     def __init__(
         self,
@@ -63,7 +78,8 @@ class VectorStore:
         
         # Initialize embedding model
         logger.info(f"Loading embedding model: {self.EMBEDDING_MODEL}")
-        self.embedder = SentenceTransformer(self.EMBEDDING_MODEL)
+        self.embedder = self._load_embedder()
+        self._query_cache: OrderedDict[str, list[float]] = OrderedDict()
         
         try:
             # ALWAYS use in-memory for reliability in single-process mode
@@ -78,6 +94,58 @@ class VectorStore:
 
         self._ensure_collection()
 
+    def _load_embedder(self) -> SentenceTransformer:
+        """
+        Load the embedding model, preferring the INT8 ONNX Runtime export.
+
+        Falls back to the PyTorch weights if the installed
+        sentence-transformers has no ONNX backend or the export can't be
+        loaded. Both produce the same 384-dim vectors.
+
+        Returns:
+            The sentence embedding model.
+        """
+        onnx_file = self._onnx_model_file()
+        if onnx_file is None:
+            logger.info(f"No quantized ONNX export for {platform.machine()}, using PyTorch")
+            return SentenceTransformer(self.EMBEDDING_MODEL)
+        try:
+            embedder = SentenceTransformer(
+                self.EMBEDDING_MODEL,
+                backend="onnx",
+                model_kwargs={"file_name": onnx_file},
+            )
+            logger.info(f"Using quantized ONNX embeddings: {onnx_file}")
+            return embedder
+        except Exception as e:
+            logger.warning(f"ONNX embeddings unavailable, using PyTorch: {e}")
+            return SentenceTransformer(self.EMBEDDING_MODEL)
+
+    @classmethod
+    def _onnx_model_file(cls) -> str | None:
+        """
+        Pick the quantized ONNX export matching this CPU.
+
+        The AVX512-VNNI export runs on generic (slower than FP32) kernels
+        without VNNI, so it is only chosen when /proc/cpuinfo reports it;
+        other x86-64 CPUs get the AVX2 export.
+
+        Returns:
+            Path of the export within the model repo, or None if there is
+            none for this architecture.
+        """
+        machine = platform.machine().lower()
+        if machine in ("arm64", "aarch64"):
+            return cls.ONNX_MODEL_FILES["arm64"]
+        if machine not in ("x86_64", "amd64"):
+            return None
+        try:
+            with open("/proc/cpuinfo", encoding="utf-8") as f:
+                has_vnni = "avx512_vnni" in f.read()
+        except OSError:
+            has_vnni = False
+        return cls.ONNX_MODEL_FILES["avx512_vnni" if has_vnni else "avx2"]
+
     def _ensure_collection(self) -> None:
         """Create collection if it doesn't exist."""
         collections = self.client.get_collections().collections
@@ -88,13 +156,45 @@ class VectorStore:
                 collection_name=self.collection_name,
                 vectors_config=VectorParams(
                     size=self.VECTOR_DIM,
-                    distance=Distance.COSINE,
+                    # Embeddings are unit-normalized, so dot product equals cosine
+                    distance=Distance.DOT,
                 ),
             )
             logger.info(f"Created collection: {self.collection_name}")
         else:
             logger.info(f"Collection already exists: {self.collection_name}")
 
+    def _encode(self, texts, **kwargs):
+        """
+        Run the embedding model under torch.inference_mode.
+
+        Inference mode skips autograd bookkeeping (version counters, view
+        tracking) that no_grad still pays for on the PyTorch fallback.
+
+        Args:
+            texts: A text or a list of texts.
+            **kwargs: Passed through to SentenceTransformer.encode.
+
+        Returns:
+            The normalized embedding(s) as a NumPy array.
+        """
+        with torch.inference_mode():
+            return self.embedder.encode(
+                texts, convert_to_numpy=True, normalize_embeddings=True, **kwargs
+            )
+
+    def embed_texts(self, texts: list[str]):
+        """
+        Embed texts without caching (e.g. fixed prototype sentences).
+
+        Args:
+            texts: Texts to embed.
+
+        Returns:
+            Normalized embeddings as a NumPy array, one row per text.
+        """
+        return self._encode(texts)
+
     def _embed_text(self, text: str) -> list[float]:
         """
         Generate embedding vector for text.
@@ -105,23 +205,42 @@ class VectorStore:
         Returns:
             Embedding vector.
         """
-        embedding = self.embedder.encode(text, convert_to_numpy=True)
+        embedding = self._encode(text)
         return embedding.tolist()
 
-    def upsert_document(self, metadata: DocumentMetadata) -> str:
+    def embed_queries(self, queries: list[str]) -> list[list[float]]:
         """
-        Store a document with its metadata in Qdrant.
+        Embed search queries, reusing cached vectors for repeated queries.
+
+        Only queries are cached; document shadow text is embedded once at
+        ingestion and never looked up again.
 
         Args:
-            metadata: Document metadata including shadow text.
+            queries: Query texts.
 
         Returns:
-            The generated document ID.
+            One embedding vector per query, in order.
         """
-        doc_id = str(uuid.uuid4())
+        cache = self._query_cache
+        misses = list(dict.fromkeys(q for q in queries if q not in cache))
+        if misses:
+            vectors = self._encode(misses).tolist()
+            for query, vector in zip(misses, vectors):
+                cache[query] = vector
+        
+        result = []
+        for query in queries:
+            cache.move_to_end(query)
+            result.append(cache[query])
+        while len(cache) > self.QUERY_CACHE_SIZE:
+            cache.popitem(last=False)
+        return result
 
-        payload = {
+    def _payload(self, metadata: DocumentMetadata) -> dict:
+        """Build the Qdrant payload for a document."""
+        return {
             "shadow_text": metadata.shadow_text,
+            "shadow_text_preview": metadata.shadow_text[:self.PREVIEW_CHARS],
             "original_image_path": metadata.original_image_path,
             "element_type": metadata.element_type,
             "source_pdf": metadata.source_pdf,
@@ -129,48 +248,106 @@ class VectorStore:
             "keywords": metadata.keywords,
         }
 
-        # Generate real embedding from shadow text
-        vector = self._embed_text(metadata.shadow_text)
+    def upsert_document(self, metadata: DocumentMetadata) -> str:
+        """
+        Store a document with its metadata in Qdrant.
 
-        point = PointStruct(
-            id=doc_id,
-            vector=vector,
-            payload=payload,
-        )
+        Args:
+            metadata: Document metadata including shadow text.
+
+        Returns:
+            The generated document ID.
+        """
+        return self.upsert_documents([metadata])[0]
+
+    def upsert_documents(self, metadata_list: list[DocumentMetadata]) -> list[str]:
+        """
+        Store several documents in Qdrant with one embedding pass and one upsert.
+
+        Args:
+            metadata_list: Document metadata including shadow text.
+
+        Returns:
+            The generated document IDs, in input order.
+        """
+        if not metadata_list:
+            return []
+
+        # Generate real embeddings from shadow text, batched
+        vectors = self._encode(
+            [metadata.shadow_text for metadata in metadata_list],
+            batch_size=self.EMBED_BATCH_SIZE,
+            show_progress_bar=False,
+        ).tolist()
+
+        doc_ids = [str(uuid.uuid4()) for _ in metadata_list]
+        points = [
+            PointStruct(
+                id=doc_id,
+                vector=vector,
+                payload=self._payload(metadata),
+            )
+            for doc_id, vector, metadata in zip(doc_ids, vectors, metadata_list)
+        ]
 
         self.client.upsert(
             collection_name=self.collection_name,
-            points=[point],
+            points=points,
         )
 
-        logger.info(
-            f"Stored document {doc_id}: {metadata.element_type} from page {metadata.page_number}"
-        )
-        return doc_id
+        if logger.isEnabledFor(logging.DEBUG):
+            for doc_id, metadata in zip(doc_ids, metadata_list):
+                logger.debug(
+                    f"Stored document {doc_id}: {metadata.element_type} from page {metadata.page_number}"
+                )
+        logger.info(f"Stored {len(doc_ids)} documents in {self.collection_name}")
+        return doc_ids
+
+    @staticmethod
+    def _payload_selector(payload_fields: list[str] | None) -> bool | PayloadSelectorInclude:
+        """Build a Qdrant payload selector; None requests the full payload."""
+        if payload_fields is None:
+            return True
+        return PayloadSelectorInclude(include=payload_fields)
 
-    def search(self, query: str, limit: int = 5) -> list[dict]:
+    def search(
+        self,
+        query: str,
+        limit: int = 5,
+        payload_fields: list[str] | None = None,
+        query_vector: list[float] | None = None,
+    ) -> list[dict]:
         """
         Search for documents similar to the query.
         
         Args:
             query: Search query text.
             limit: Maximum number of results.
+            payload_fields: Payload keys to return (default: all).
+            query_vector: Precomputed query embedding (skips embedding).
             
         Returns:
             List of matching documents with scores.
         """
-        query_vector = self._embed_text(query)
+        with_payload = self._payload_selector(payload_fields)
+        if query_vector is None:
+            query_vector = self.embed_queries([query])[0]
         print(f"DEBUG: Searching Qdrant with vector length: {len(query_vector)}")
         
         try:
             # Try qdrant-client v1.7+ API first (query_points)
             if hasattr(self.client, 'query_points'):
-                from qdrant_client.models import models
                 results = self.client.query_points(
                     collection_name=self.collection_name,
+                    prefetch=[
+                        Prefetch(
+                            query=query_vector,
+                            limit=max(limit, self.PREFETCH_LIMIT),
+                        )
+                    ],
                     query=query_vector,
                     limit=limit,
-                    with_payload=True,
+                    with_payload=with_payload,
                 ).points
             else:
                 # Fallback to older .search() API
@@ -178,7 +355,7 @@ class VectorStore:
                     collection_name=self.collection_name,
                     query_vector=query_vector,
                     limit=limit,
-                    with_payload=True,
+                    with_payload=with_payload,
                 )
         except Exception as e:
             print(f"\n{'='*60}\nCRITICAL SEARCH ERROR: {e}\n{'='*60}\n")
@@ -195,28 +372,117 @@ class VectorStore:
         
         return documents
 
-    def get_all_documents(self) -> list[dict]:
+    def search_many(
+        self,
+        queries: list[str],
+        limit: int = 5,
+        payload_fields: list[str] | None = None,
+        query_vectors: list[list[float]] | None = None,
+    ) -> list[list[dict]]:
         """
-        Retrieve all documents from the collection.
+        Search for several queries in a single Qdrant request.
+        
+        Args:
+            queries: Search query texts.
+            limit: Maximum number of results per query.
+            payload_fields: Payload keys to return (default: all).
+            query_vectors: Precomputed query embeddings (skips embedding).
+            
+        Returns:
+            One list of matching documents with scores per query, in order.
+        """
+        with_payload = self._payload_selector(payload_fields)
+        if query_vectors is None:
+            query_vectors = self.embed_queries(queries)
+        requests = [
+            QueryRequest(
+                prefetch=[
+                    Prefetch(
+                        query=vector,
+                        limit=max(limit, self.PREFETCH_LIMIT),
+                    )
+                ],
+                query=vector,
+                limit=limit,
+                with_payload=with_payload,
+            )
+            for vector in query_vectors
+        ]
+        
+        try:
+            responses = self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=requests,
+            )
+        except Exception as e:
+            logger.error(f"Qdrant batch search failed: {e}", exc_info=True)
+            return [[] for _ in queries]
+        
+        return [
+            [
+                {
+                    "id": str(hit.id),
+                    "score": hit.score,
+                    **hit.payload,
+                }
+                for hit in response.points
+            ]
+            for response in responses
+        ]
 
+    def get_shadow_texts(self, ids: list[str]) -> dict[str, str]:
+        """
+        Fetch the full shadow text for specific documents.
+        
+        Args:
+            ids: Document IDs.
+            
         Returns:
-            List of document payloads.
+            Mapping of document ID to shadow text.
         """
-        result = self.client.scroll(
+        points = self.client.retrieve(
             collection_name=self.collection_name,
-            limit=1000,
-            with_payload=True,
+            ids=ids,
+            with_payload=PayloadSelectorInclude(include=["shadow_text"]),
             with_vectors=False,
         )
+        return {str(p.id): p.payload.get("shadow_text", "") for p in points}
 
-        documents = []
-        for point in result[0]:
-            documents.append({
-                "id": point.id,
-                **point.payload,
-            })
+    def iter_documents(self, batch_size: int = 512) -> Iterator[dict]:
+        """
+        Stream all documents from the collection, one scroll page at a time.
 
-        return documents
+        Args:
+            batch_size: Points fetched per scroll request.
+
+        Yields:
+            Document payloads with their IDs.
+        """
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            for point in points:
+                yield {
+                    "id": point.id,
+                    **point.payload,
+                }
+            if offset is None:
+                break
+
+    def get_all_documents(self) -> list[dict]:
+        """
+        Retrieve all documents from the collection.
+
+        Returns:
+            List of document payloads.
+        """
+        return list(self.iter_documents())
 
     def count_documents(self) -> int:
         """Get the total number of documents in the collection."""
@@ -1,3 +1,5 @@
+import asyncio
+import json
 import shutil
 import logging
 from pathlib import Path
@@ -6,6 +8,7 @@ from typing import Annotated
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
@@ -49,6 +52,7 @@ app.add_middleware(
 _settings = None
 _rag_graph = None
 _transcriber = None
+_gemini_semaphore = None
 _vector_store = None
 
 def get_settings():
@@ -74,6 +78,8 @@ def get_rag_graph():
             groq_api_key=settings.groq_api_key,
             vector_store=shared_vector_store,
             model_name=settings.groq_model,
+            cosine_accept=settings.grade_cosine_accept,
+            cosine_reject=settings.grade_cosine_reject,
         )
         logger.info("RAG graph initialized successfully with SHARED VectorStore")
     return _rag_graph
@@ -93,6 +99,13 @@ def get_transcriber():
         logger.info("Gemini transcriber initialized")
     return _transcriber
 
+def get_gemini_semaphore():
+    """Get the process-wide limit on concurrent Gemini transcriptions."""
+    global _gemini_semaphore
+    if _gemini_semaphore is None:
+        _gemini_semaphore = asyncio.Semaphore(get_settings().gemini_concurrency)
+    return _gemini_semaphore
+
 def get_vector_store():
     """Lazy-load the VectorStore on first use."""
     global _vector_store
@@ -153,6 +166,7 @@ async def handle_ingestion(file_path: Path, filename: str):
             transcriber=get_transcriber(),
             vector_store=get_vector_store(),
             progress_callback=update_progress,
+            gemini_semaphore=get_gemini_semaphore(),
         )
         logger.info(f"Ingestion complete for {filename}: {stats}")
         ingestion_status[filename] = {
@@ -242,6 +256,20 @@ async def ingest_document(
         logger.error(f"Upload failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _initial_state(query: str) -> dict:
+    """Build the starting graph state for a chat query."""
+    return {
+        "query": query,
+        "documents": [],
+        "relevant_documents": [],
+        "generation": None,
+        "retry_count": 0,
+        "rewritten_query": None,
+        "prefetched_rewrite_docs": None,
+        "interactive": True,
+        "query_embedding": None,
+    }
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     try:
@@ -249,20 +277,11 @@ async def chat(request: ChatRequest):
         
         rag_graph = get_rag_graph()
         
-        initial_state = {
-            "query": request.query,
-            "documents": [],
-            "relevant_documents": [],
-            "generation": None,
-            "retry_count": 0,
-            "rewritten_query": None,
-        }
-        
-        result = await rag_graph.ainvoke(initial_state)
+        result = await rag_graph.ainvoke(_initial_state(request.query))
         
         return {
             "response": result.get("generation") or "I couldn't generate a response.",
-            "documents": result.get("relevant_documents", []),
+            "documents": [doc.to_dict() for doc in result.get("relevant_documents", [])],
             "rewritten_query": result.get("rewritten_query")
         }
         
@@ -270,6 +289,42 @@ async def chat(request: ChatRequest):
         logger.error(f"Chat failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Stream the answer as newline-delimited JSON.
+    
+    Emits {"type": "token", "content": ...} events while the answer is
+    generated, then a final {"type": "done", ...} event with the same
+    fields as /chat.
+    """
+    logger.info(f"Chat Stream Request: {request.query}")
+    rag_graph = get_rag_graph()
+    
+    async def event_stream():
+        result: dict = {}
+        try:
+            async for mode, chunk in rag_graph.astream(
+                _initial_state(request.query),
+                stream_mode=["custom", "values"],
+            ):
+                if mode == "custom" and "generation_delta" in chunk:
+                    yield json.dumps({"type": "token", "content": chunk["generation_delta"]}) + "\n"
+                elif mode == "values":
+                    result = chunk
+            
+            yield json.dumps({
+                "type": "done",
+                "response": result.get("generation") or "I couldn't generate a response.",
+                "documents": [doc.to_dict() for doc in result.get("relevant_documents", [])],
+                "rewritten_query": result.get("rewritten_query"),
+            }) + "\n"
+        except Exception as e:
+            logger.error(f"Chat stream failed: {e}", exc_info=True)
+            yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+    
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
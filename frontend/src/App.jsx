@@ -213,6 +213,7 @@ export default function App() {
     ])
     const [input, setInput] = useState("")
     const [isThinking, setIsThinking] = useState(false)
+    const [isStreaming, setIsStreaming] = useState(false)
     const [isUploading, setIsUploading] = useState(false)
     const [isResetting, setIsResetting] = useState(false)
     const scrollRef = useRef(null)
@@ -230,30 +231,70 @@ export default function App() {
         setInput("")
         setIsThinking(true)
 
+        // Replace the streaming bot message (always the last one) in place
+        const updateBotMessage = (patch) => setMessages(prev => [
+            ...prev.slice(0, -1),
+            { ...prev[prev.length - 1], ...patch }
+        ]);
+
+        setIsStreaming(true)
+        let started = false
         try {
-            const response = await fetch(`${API_URL}/chat`, {
+            const response = await fetch(`${API_URL}/chat/stream`, {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({ query: userMsg.text })
             });
 
-            if (!response.ok) throw new Error("Failed to fetch response");
-
-            const data = await response.json();
-
-            setMessages(prev => [...prev, {
-                text: data.response,
-                documents: data.documents,
-                isBot: true
-            }]);
+            if (!response.ok || !response.body) throw new Error("Failed to fetch response");
+
+            // Newline-delimited JSON: token events, then one done/error event
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
+            let text = "";
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                const lines = buffer.split("\n");
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const event = JSON.parse(line);
+
+                    if (event.type === "error") throw new Error(event.message);
+
+                    if (!started) {
+                        started = true;
+                        setIsThinking(false);
+                        setMessages(prev => [...prev, { text: "", isBot: true }]);
+                    }
+
+                    if (event.type === "token") {
+                        text += event.content;
+                        updateBotMessage({ text });
+                    } else if (event.type === "done") {
+                        updateBotMessage({ text: event.response, documents: event.documents });
+                    }
+                }
+            }
         } catch (error) {
             console.error("Chat error:", error);
-            setMessages(prev => [...prev, {
+            const errorMsg = {
                 text: "**Error:** Could not connect to the AI. Is the backend running?",
                 isBot: true
-            }]);
+            };
+            if (started) {
+                updateBotMessage(errorMsg);
+            } else {
+                setMessages(prev => [...prev, errorMsg]);
+            }
         } finally {
             setIsThinking(false);
+            setIsStreaming(false);
         }
     }
 
@@ -398,9 +439,9 @@ export default function App() {
                             placeholder="Ask a question about your documents..."
                             className="input-field"
                             style={{ paddingLeft: '1rem' }}
-                            disabled={isThinking}
+                            disabled={isThinking || isStreaming}
                         />
-                        <button onClick={handleSend} disabled={isThinking} className="btn-send absolute right-2 top-1/2 -translate-y-1/2">
+                        <button onClick={handleSend} disabled={isThinking || isStreaming} className="btn-send absolute right-2 top-1/2 -translate-y-1/2">
                             <Send size={20} />
                         </button>
                     </div>